@@ -97,119 +97,241 @@
 #     
 # </ul>
 
+import os
+import hashlib
+import secrets
+import warnings
+import functools
+import importlib
+import importlib.metadata
 import openmc
-import neutronics_material_maker as nmm
 
-all_materials = nmm.AvailableMaterials()
+# The materials are built on first access (NeutronicsMaterials.Stainless_steel_316L, from ... import Mirrobor)
+# by the module __getattr__, then kept as module attributes : importing the module builds nothing and
+# neutronics_material_maker is only imported when a material of its library is needed.
+# A material used by another one is obtained with material(name), built once and shared.
+# The built materials are also saved (OpenMC xml, expanded nuclides and density) in a cache directory,
+# $ICONE_MATERIALS_CACHE or ~/.cache/icone/materials (ICONE_MATERIALS_CACHE="" to disable it), in a
+# sub-directory keyed by this file and the neutronics_material_maker and openmc versions : the other
+# processes read them back without neutronics_material_maker, and a change of the definitions or of the
+# libraries starts a new cache.
+
+@functools.lru_cache(maxsize=None)
+def _nmm():
+    return importlib.import_module('neutronics_material_maker')
+
+@functools.lru_cache(maxsize=None)
+def _available():
+    return _nmm().AvailableMaterials()
 
 def MatinList(material):
-    return material in all_materials
+    return material in _available()
 
 def LookFor(string):
-    for i in all_materials:
+    for i in _available():
         i_lower = i.lower()
         if string.lower() in i_lower:
             print(i)
 
 def addElem(element):
-    if element in all_materials:
-        return nmm.Material.from_library(element).openmc_material
+    if element in _available():
+        return _nmm().Material.from_library(element).openmc_material
     else:
         print(f"the element '{element}' is not in the list, use LookFor() to help")
 
 def addMat(material):
-    if material in all_materials:
-        return nmm.Material.from_library(material, temperature=300, pressure= 1.3e5).openmc_material
+    if material in _available():
+        return _nmm().Material.from_library(material, temperature=300, pressure= 1.3e5).openmc_material
     else:
         print(f"the element '{material}' is not in the list, use LookFor() to help")
+
+@functools.lru_cache(maxsize=None)
+def _cacheDir():
+    root = os.environ.get('ICONE_MATERIALS_CACHE', os.path.join('~', '.cache', 'icone', 'materials'))
+    if not root:
+        return None
+    key = hashlib.sha256()
+    with open(__file__, 'rb') as f:
+        key.update(f.read())
+    try:
+        nmmVersion = importlib.metadata.version('neutronics_material_maker')
+    except importlib.metadata.PackageNotFoundError:
+        nmmVersion = 'unknown'
+    key.update(f"nmm {nmmVersion} openmc {openmc.__version__}".encode())
+    return os.path.join(os.path.expanduser(root), key.hexdigest()[:16])
+
+def _loadCached(name):
+    cacheDir = _cacheDir()
+    if cacheDir is None or not os.path.exists(os.path.join(cacheDir, name + '.xml')):
+        return None
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore') # the id saved in the file may be already used
+        mat = openmc.Materials.from_xml(os.path.join(cacheDir, name + '.xml'))[0]
+    mat.id = None # a new id, no clash with the materials of the model
+    return mat
+
+def _saveCached(name, mat):
+    cacheDir = _cacheDir()
+    if cacheDir is None or mat is None:
+        return
+    try:
+        os.makedirs(cacheDir, exist_ok=True)
+        tmpFile = os.path.join(cacheDir, f".{name}.{os.getpid()}.{secrets.token_hex(4)}.xml")
+        openmc.Materials([mat]).export_to_xml(tmpFile)
+        os.replace(tmpFile, os.path.join(cacheDir, name + '.xml'))
+    except OSError: # read-only or full file system : no cache
+        pass
+
+# name of the material in the module -> function building it
+_BUILDERS = {}
+
+def _builder(function):
+    _BUILDERS[function.__name__[1:]] = function
+    return function
+
+def material(name):
+    if name not in _BUILDERS:
+        raise AttributeError(f"module {__name__!r} has no material {name!r}")
+    if name not in globals():
+        mat = _loadCached(name)
+        if mat is None:
+            mat = _BUILDERS[name]()
+            _saveCached(name, mat)
+        globals()[name] = mat
+    return globals()[name]
+
+def __getattr__(name):
+    if name == 'all_materials':
+        return _available()
+    if name not in _BUILDERS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    return material(name)
+
+def __dir__():
+    return sorted(set(globals()) | set(_BUILDERS) | {'all_materials'})
         
 ############# Materials ##############
 ################################### Elements definition #########################################
-Al = addMat("Aluminum")
-Cu = addMat("Copper")
-Be = addMat("Beryllium")
-Tl = addMat("Tantalum")
-Al = addMat("Aluminum")
-O = addMat("Oxygen")
-Cr = addMat("Chromium")
-Au = addMat("Gold")
-W = addMat("Tungsten")
-Mo = addMat("Molybdenum")
-Hg = addMat("Mercury")
-Na = addMat("Sodium")
-Mg = addMat ("Magnesium")
-Si = addMat ("Silicon")
-Fe = addMat ("Iron")
-H = addMat ("Hydrogen")
-B = addMat ("Boron")
-Sn = addMat ("Tin")
-Pb = addMat("Lead")
-
-Mn = openmc.Material(name='Mn')
-Mn.add_element('Mn',1.,'ao')
-Mn.set_density('g/cm3',7.26)
-
-C = openmc.Material(name='C')
-C.add_element('C',1.,'ao')
-C.set_density('g/cm3',2.2)
-
-Co = openmc.Material(name='Co')
-Co.add_element('Co',1.,'ao')
-Co.set_density('g/cm3',8.90)
-
-K = openmc.Material(name='Potassium')
-K.add_element('K',1.,'ao')
-K.set_density('g/cm3',0.89)
-
-Ca = openmc.Material(name='Calcium')
-Ca.add_element('Ca',1.,'ao')
-Ca.set_density('g/cm3',1.55)
-
-Sb = openmc.Material(name='Antimony')
-Sb.add_element('Sb',1.,'ao')
-Sb.set_density('g/cm3',6.68)
+# from the neutronics_material_maker library
+_LIBRARY = {
+    'Al': "Aluminum",
+    'Cu': "Copper",
+    'Be': "Beryllium",
+    'Tl': "Tantalum",
+    'O': "Oxygen",
+    'Cr': "Chromium",
+    'Au': "Gold",
+    'W': "Tungsten",
+    'Mo': "Molybdenum",
+    'Hg': "Mercury",
+    'Na': "Sodium",
+    'Mg': "Magnesium",
+    'Si': "Silicon",
+    'Fe': "Iron",
+    'H': "Hydrogen",
+    'B': "Boron",
+    'Sn': "Tin",
+    'Pb': "Lead",
+}
+
+# single elements : (material name, element, density g/cm3)
+_ELEMENTS = {
+    'Mn': ('Mn', 'Mn', 7.26),
+    'C': ('C', 'C', 2.2),
+    'Co': ('Co', 'Co', 8.90),
+    'K': ('Potassium', 'K', 0.89),
+    'Ca': ('Calcium', 'Ca', 1.55),
+    'Sb': ('Antimony', 'Sb', 6.68),
+}
+
+def _element(name, element, density):
+    mat = openmc.Material(name=name)
+    mat.add_element(element,1.,'ao')
+    mat.set_density('g/cm3',density)
+    return mat
 
 ##################################################################################
 
-water = addMat("H2O")
+_LIBRARY.update({
+    'water': "H2O",
+    'Al_5086_O': "Aluminum, alloy 5086-O",
+    'Stainless_steel_440A': "Steel, Stainless 440A",
+    'Stainless_steel_304': "Steel, Stainless 304",
+    'Stainless_steel_304L': "Steel, Stainless 304L",
+    'Stainless_steel_316': "Steel, Stainless 316",
+    'Stainless_steel_316L': "Steel, Stainless 316L",
+    'Polyethylene': "Polyethylene, Non-borated",
+})
+
+for _name, _library in _LIBRARY.items():
+    _BUILDERS[_name] = functools.partial(addMat, _library)
+for _name, _arguments in _ELEMENTS.items():
+    _BUILDERS[_name] = functools.partial(_element, *_arguments)
+del _name, _library, _arguments
+
+@_builder
+def _Moldmax_XL():
+    Moldmax_XL = openmc.Material(name = "Moldmax XL") 
+    Moldmax_XL.set_density('g/cm3', 8.9)
+    Moldmax_XL.add_element('Ni' , 9. , 'wo')
+    Moldmax_XL.add_element('Sn' , 6. , 'wo')
+    Moldmax_XL.add_element('Cu' , 75. , 'wo')
+    return Moldmax_XL
+
+@_builder
+def _AlBeMet():
+    AlBeMet = openmc.Material.mix_materials([material(m) for m in ['Be','Al','O','C','Mn','Cr','Tl','Au','W','Mo','Hg','Co']],
+                                            [62/100, 37/100, 0.2/100, 0.1/100, 0.0875/100, 0.0875/100, 0.0875/100, 0.0875/100,0.0875/100,0.0875/100,0.0875/100,0.0875/100], 
+                                            "wo", name= 'AlBeMet')
+    AlBeMet.set_density('g/cm3',2.1)
+    return AlBeMet
+
+@_builder
+def _Ordinary_concrete():
+    return openmc.Material.mix_materials([material(m) for m in ['H', 'O', 'Na', 'Mg', 'Al', 'Si', 'K', 'Ca', 'Fe']],[0.5568/100, 49.892/100, 1.71623/100, 0.2592/100, 4.58488/100, 31.55/100, 1.91807/100, 8.29198/100, 1.23084/100], "wo", name= 'Ordinary concrete')
 
-Al_5086_O = addMat("Aluminum, alloy 5086-O")
+@_builder
+def _Boron_carbide():
+    return openmc.Material.mix_materials([material('B'), material('C')],[4/5, 1/5], "ao", name= 'Boron carbide')
 
-Stainless_steel_440A = addMat("Steel, Stainless 440A")
-Stainless_steel_304 = addMat("Steel, Stainless 304")
-Stainless_steel_304L = addMat("Steel, Stainless 304L")
-Stainless_steel_316 = addMat("Steel, Stainless 316")
-Stainless_steel_316L = addMat("Steel, Stainless 316L")
+@_builder
+def _Concrete_PE():
+    return openmc.Material.mix_materials([material('Ordinary_concrete'), material('Polyethylene')],[50/100, 50/100], "wo", name= 'Concrete inner layer')
 
-Moldmax_XL = openmc.Material(name = "Moldmax XL") 
-Moldmax_XL.set_density('g/cm3', 8.9)
-Moldmax_XL.add_element('Ni' , 9. , 'wo')
-Moldmax_XL.add_element('Sn' , 6. , 'wo')
-Moldmax_XL.add_element('Cu' , 75. , 'wo')
+@_builder
+def _Concrete_B4C():
+    return openmc.Material.mix_materials([material('Ordinary_concrete'), material('Boron_carbide')],[98/100, 2/100], "wo", name= 'Concrete outer layer')
 
-AlBeMet = openmc.Material.mix_materials([Be,Al,O, C ,Mn,Cr,Tl,Au, W, Mo, Hg, Co],
-                                        [62/100, 37/100, 0.2/100, 0.1/100, 0.0875/100, 0.0875/100, 0.0875/100, 0.0875/100,0.0875/100,0.0875/100,0.0875/100,0.0875/100], 
-                                        "wo", name= 'AlBeMet')
-AlBeMet.set_density('g/cm3',2.1)
+@_builder
+def _glue():
+    return openmc.Material.mix_materials([material('H'), material('C'), material('O')],[5/100, 70/100, 25/100], "wo", name= 'glue')
 
-Ordinary_concrete = openmc.Material.mix_materials([H, O, Na, Mg, Al, Si, K, Ca, Fe],[0.5568/100, 49.892/100, 1.71623/100, 0.2592/100, 4.58488/100, 31.55/100, 1.91807/100, 8.29198/100, 1.23084/100], "wo", name= 'Ordinary concrete')
-Boron_carbide = openmc.Material.mix_materials([B, C],[4/5, 1/5], "ao", name= 'Boron carbide')
+@_builder
+def _Mirrobor():
+    Mirrobor = openmc.Material.mix_materials([material('Boron_carbide'), material('glue')],[80/100, 20/100], "wo", name= 'Mirrobor')
+    Mirrobor.set_density('g/cm3',1.55)
+    return Mirrobor
 
-Polyethylene = addMat("Polyethylene, Non-borated")
+@_builder
+def _Lead_Tin():
+    Lead_Tin = openmc.Material.mix_materials([material('Pb'), material('Sn')],[96/100, 4/100], "wo", name= 'Lead Tin')
+    Lead_Tin.set_density('sum') # density = 11.10 g/cm3
+    return Lead_Tin
 
-Concrete_PE = openmc.Material.mix_materials([Ordinary_concrete, Polyethylene],[50/100, 50/100], "wo", name= 'Concrete inner layer')
-Concrete_B4C = openmc.Material.mix_materials([Ordinary_concrete, Boron_carbide],[98/100, 2/100], "wo", name= 'Concrete outer layer')
+@_builder
+def _Lead_Antimony():
+    Lead_Antimony = openmc.Material.mix_materials([material('Pb'), material('Sb')],[96/100, 4/100], "wo", name= 'Lead Antimony')
+    Lead_Antimony.set_density('g/cm3',11.04)
+    return Lead_Antimony
 
-glue = openmc.Material.mix_materials([H, C, O],[5/100, 70/100, 25/100], "wo", name= 'glue')
-Mirrobor = openmc.Material.mix_materials([Boron_carbide, glue],[80/100, 20/100], "wo", name= 'Mirrobor')
-Mirrobor.set_density('g/cm3',1.55)
+@_builder
+def _Lead_Calcium():
+    Lead_Calcium = openmc.Material.mix_materials([material('Pb'), material('Ca')],[99.85/100, 0.15/100], "wo", name= 'Lead Calcium')
+    Lead_Calcium.set_density('g/cm3',11.34)
+    return Lead_Calcium
 
-Lead_Tin = openmc.Material.mix_materials([Pb, Sn],[96/100, 4/100], "wo", name= 'Lead Tin')
-Lead_Tin.set_density('sum') # density = 11.10 g/cm3
-Lead_Antimony = openmc.Material.mix_materials([Pb, Sb],[96/100, 4/100], "wo", name= 'Lead Antimony')
-Lead_Antimony.set_density('g/cm3',11.04)
-Lead_Calcium = openmc.Material.mix_materials([Pb, Ca],[99.85/100, 0.15/100], "wo", name= 'Lead Calcium')
-Lead_Calcium.set_density('g/cm3',11.34)
+# from NeutronicsMaterials import * still gives all the materials (they are all built then)
+__all__ = ['MatinList', 'LookFor', 'addElem', 'addMat', 'material', 'all_materials'] + list(_BUILDERS)
 
 
 # EXEMPLES D'UTILISATION
@@ -219,7 +341,7 @@ Lead_Calcium.set_density('g/cm3',11.34)
 # print(Polyethylene)
 # print(Lead_Tin)
 
-# all_materials = nmm.AvailableMaterials()
+# from NeutronicsMaterials import all_materials
 # print(all_materials.keys())
 
 # LookFor("stainless")
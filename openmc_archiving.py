@@ -1,28 +1,181 @@
 import os
 import shutil
+import filecmp
+import hashlib
 import datetime
 import json
+import io
+import tarfile
+import sqlite3
+import socket
+import secrets
+import glob
+import itertools
+import concurrent.futures
+import numpy as np
+import h5py
 from lxml import etree
 import lxml.builder
 
 # create an archive "run_date_time" in the current calculation directory
 # should the script file itself be saved ?
+# the names are unique across simultaneous jobs : date and time to the microsecond, host, process and a random suffix
+# (they still sort by date), see archiveRun to archive from many jobs at once
 
-# INPUT : none
-# OUTPUT : a new folder "run_date_time"
-def createArchiveDirectory():
+# OUTPUT : a new unique run identifier "run_date_time_microseconds_host_pid_random"
+def runId():
     now = datetime.datetime.now()
-    formatted_date = now.strftime("%Y%m%d_%H%M%S")
-    datafolder="./run_"+formatted_date+"/"
-    os.mkdir(datafolder)
-    return datafolder
+    host = socket.gethostname().split('.')[0].replace('_', '-')
+    return "run_" + now.strftime("%Y%m%d_%H%M%S_%f") + f"_{host}_{os.getpid()}_{secrets.token_hex(3)}"
+
+# INPUT : the directory in which the archive is created (current directory by default)
+# OUTPUT : a new folder "run_date_time_..."
+def createArchiveDirectory(root = '.'):
+    while True:
+        datafolder = os.path.join(root, runId()) + "/"
+        try:
+            os.mkdir(datafolder)
+            return datafolder
+        except FileExistsError:
+            continue
+
+# Catalog of the archived runs
+# a SQLite file updated by createArchivedDataset(..., catalog=<file>) (one catalog for all the runs, give
+# the same file to every call, CATALOG is the name used by default by the functions below),
+# with the source and geometry names and parameters, and the files (size, sha256) of every run
+#  > queryRuns(source='Be40', e0=(20, 30)) # parameters by value or (min, max) range, 'geometry.e0' to be specific
+#  > rebuildCatalog('.') # from the configuration.json files found on disk
+CATALOG = 'run_catalog.sqlite'
+
+# INPUT : the catalog file
+# OUTPUT : a sqlite3 connection, the tables are created if needed
+def openCatalog(catalog = CATALOG):
+    connection = sqlite3.connect(catalog, timeout=60)
+    connection.executescript("""
+        CREATE TABLE IF NOT EXISTS runs (id INTEGER PRIMARY KEY, path TEXT UNIQUE, created TEXT,
+                                         comment TEXT, source TEXT, geometry TEXT, configuration TEXT);
+        CREATE TABLE IF NOT EXISTS parameters (run_id INTEGER, kind TEXT, name TEXT, value REAL, text TEXT);
+        CREATE TABLE IF NOT EXISTS files (run_id INTEGER, name TEXT, size INTEGER, hash TEXT);
+        CREATE INDEX IF NOT EXISTS runs_source ON runs (source);
+        CREATE INDEX IF NOT EXISTS runs_geometry ON runs (geometry);
+        CREATE INDEX IF NOT EXISTS parameters_name ON parameters (name, value);
+        CREATE INDEX IF NOT EXISTS parameters_run ON parameters (run_id);
+        CREATE INDEX IF NOT EXISTS files_run ON files (run_id);
+    """)
+    return connection
+
+# INPUT : an open catalog connection
+# OUTPUT : the hashes already recorded {(run path, file name, size) : hash}
+def knownHashes(connection, path = None):
+    query = "SELECT runs.path, files.name, files.size, files.hash FROM files JOIN runs ON files.run_id = runs.id WHERE files.hash IS NOT NULL"
+    rows = connection.execute(query + " AND runs.path = ?", (path,)) if path else connection.execute(query)
+    return {(row[0], row[1], row[2]): row[3] for row in rows}
+
+# INPUT : an open catalog connection, an archive directory, hashFiles=True to compute the missing hashes,
+#         known : hashes already known (see knownHashes)
+# OUTPUT : the run, its parameters and its files are inserted (replacing a previous record of the same directory),
+#          the hashes come from the store (configuration.json), from a previous record of the same file or are computed
+def addToCatalog(connection, archDir, hashFiles = False, known = None):
+    with open(os.path.join(archDir, 'configuration.json')) as f:
+        configuration = json.load(f)
+    path = os.path.abspath(archDir)
+    hashes = configuration['files'].get('hashes', {})
+    known = {**(known or {}), **knownHashes(connection, path)}
+    removeFromCatalog(connection, path)
+    cursor = connection.execute(
+        "INSERT INTO runs (path, created, comment, source, geometry, configuration) VALUES (?, ?, ?, ?, ?, ?)",
+        (path, datetime.datetime.fromtimestamp(os.path.getmtime(os.path.join(archDir, 'configuration.json'))).isoformat(),
+         configuration.get('comment'), configuration['source']['sourceName'],
+         configuration['geometry']['geometryName'], json.dumps(configuration)))
+    runId = cursor.lastrowid
+    for kind in ('source', 'geometry'):
+        for name, value in configuration[kind][kind + 'Parameters'].items():
+            number = value if isinstance(value, (int, float)) and not isinstance(value, bool) else None
+            connection.execute("INSERT INTO parameters VALUES (?, ?, ?, ?, ?)",
+                               (runId, kind, name, number, None if number is not None else json.dumps(value)))
+    for name in sorted(os.listdir(archDir)):
+        filePath = os.path.join(archDir, name)
+        if os.path.isfile(filePath):
+            size = os.path.getsize(filePath)
+            digest = hashes.get(name) or known.get((path, name, size)) or (fileHash(filePath) if hashFiles else None)
+            connection.execute("INSERT INTO files VALUES (?, ?, ?, ?)", (runId, name, size, digest))
+
+# INPUT : an open catalog connection, the absolute path of an archive directory
+# OUTPUT : the records of this run are deleted
+def removeFromCatalog(connection, path):
+    for (runId,) in connection.execute("SELECT id FROM runs WHERE path = ?", (path,)).fetchall():
+        for table in ('parameters', 'files'):
+            connection.execute(f"DELETE FROM {table} WHERE run_id = ?", (runId,))
+        connection.execute("DELETE FROM runs WHERE id = ?", (runId,))
+
+# INPUT : an archive directory (with its configuration.json), the catalog file,
+#         hashFiles=False not to compute the sha256 of the files not archived in a store
+# OUTPUT : the run is (re)recorded in the catalog
+def catalogRun(archDir, catalog = CATALOG, hashFiles = True):
+    with openCatalog(catalog) as connection:
+        addToCatalog(connection, archDir, hashFiles)
+    connection.close()
+
+# INPUT : the root directory of the archives, the catalog file, hashFiles=True to compute the unknown hashes
+# OUTPUT : the catalog is emptied and filled again with all the run directories found below root, their number is returned
+#          (the hashes of the files already recorded with the same size are kept)
+def rebuildCatalog(root = '.', catalog = CATALOG, hashFiles = False):
+    with openCatalog(catalog) as connection:
+        known = knownHashes(connection)
+        for table in ('runs', 'parameters', 'files'):
+            connection.execute(f"DELETE FROM {table}")
+        count = 0
+        for directory, subDirs, fileNames in os.walk(root):
+            subDirs[:] = [d for d in subDirs if not d.startswith('.')] # archives being staged
+            if 'configuration.json' in fileNames:
+                addToCatalog(connection, directory, hashFiles, known)
+                count += 1
+    connection.close()
+    return count
+
+# INPUT : the catalog file, the source and geometry names, parameters as name=value or name=(min, max)
+#         ('geometry.e0' or 'source.E' to choose the kind of parameter)
+# OUTPUT : the list of the matching runs {'path', 'created', 'comment', 'source', 'geometry'}, by creation date
+def queryRuns(catalog = CATALOG, source = None, geometry = None, **parameters):
+    conditions, values = [], []
+    for column, value in (('source', source), ('geometry', geometry)):
+        if value is not None:
+            conditions.append(f"runs.{column} = ?")
+            values.append(value)
+    for name, value in parameters.items():
+        kind, _, name = name.rpartition('.')
+        condition = "EXISTS (SELECT 1 FROM parameters p WHERE p.run_id = runs.id AND p.name = ?"
+        values.append(name)
+        if kind:
+            condition += " AND p.kind = ?"
+            values.append(kind)
+        if isinstance(value, (tuple, list)):
+            condition += " AND p.value BETWEEN ? AND ?"
+            values += list(value)
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            condition += " AND p.value = ?"
+            values.append(value)
+        else:
+            condition += " AND p.text = ?"
+            values.append(json.dumps(value))
+        conditions.append(condition + ")")
+    query = "SELECT path, created, comment, source, geometry FROM runs"
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+    connection = openCatalog(catalog)
+    rows = connection.execute(query + " ORDER BY created", values).fetchall()
+    connection.close()
+    return [dict(zip(('path', 'created', 'comment', 'source', 'geometry'), row)) for row in rows]
 
 # INPUT : the archive directory (as create by the above procedure) + a file to archive
 # OUTPUT : the file is moved in the new directory
 # TO DO : error processing especially checking the file to be saved exists
 def archiveFile(archdir,myFile):
     if os.path.exists(myFile):
-        os.rename(myFile, archdir+myFile)
+        try:
+            os.rename(myFile, archdir+myFile)
+        except OSError: # archive on another file system (working directory on the node $TMPDIR...)
+            shutil.move(myFile, archdir+myFile)
     else:
         print("The file "+myFile+" does not exist")
 
@@ -72,12 +225,58 @@ def createArchivedDatasetXML(archDir, # COMPULSORY, NEEDS TO BE SPECIFIED
     with open(archdir+'configuration.xml', 'wb') as f:
         f.write(xml_string.encode('utf-8'))
         
+# Content-addressed store shared by the archives
+# each file is kept once in store/objects/<2 first hex digits>/<sha256>, read-only, and hard-linked into the
+# run directories (symbolic link across file systems): identical inputs, scripts or outputs are stored once
+# and archiving a run moves no data when the store is on the same file system as the runs
+
+# INPUT : a file
+# OUTPUT : its sha256 (hexadecimal), read by blocks
+def fileHash(myFile):
+    sha256 = hashlib.sha256()
+    with open(myFile, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 24), b''):
+            sha256.update(block)
+    return sha256.hexdigest()
+
+# INPUT : the archive directory + a file to archive + the store directory
+#         move=False to keep the file in place (the script)
+# OUTPUT : the file is in the store and linked in the archive directory, its hash is returned
+def archiveFileToStore(archDir, myFile, store, move = True):
+    if not os.path.exists(myFile):
+        print("The file "+myFile+" does not exist")
+        return None
+    digest = fileHash(myFile)
+    objectFile = os.path.join(store, 'objects', digest[:2], digest)
+    os.makedirs(os.path.dirname(objectFile), exist_ok=True)
+    if not os.path.exists(objectFile):
+        tmpFile = f"{objectFile}.{runId()}.tmp"
+        if move:
+            try:
+                os.rename(myFile, tmpFile)
+            except OSError: # store on another file system
+                shutil.copyfile(myFile, tmpFile)
+        else:
+            shutil.copyfile(myFile, tmpFile)
+        os.chmod(tmpFile, 0o444)
+        os.replace(tmpFile, objectFile)
+    if move and os.path.exists(myFile):
+        os.remove(myFile)
+    linkFile = os.path.join(archDir, os.path.basename(myFile))
+    try:
+        os.link(objectFile, linkFile)
+    except OSError:
+        os.symlink(os.path.abspath(objectFile), linkFile)
+    return digest
+
 # INPUT : the archive directory (as create by the above procedure) + the sp_filename
 #         the other files are saved with their default name model.xml, summary.h5, surface_source.h5
 #         the script actually used for the simulation
 #         the source model used for the simulations and the corresponding parameters (input as a dictionnary)
 #         the geometry model used for the simulations and the corresponding parameters (input as a dictionnary)
-# OUTPUT : the files are moved in the archive directory
+#         store : a store directory to keep the files in the content-addressed store (see archiveFileToStore)
+#         catalog : a run catalog to update (see queryRuns), None (default) not to record the run
+# OUTPUT : the files are moved in the archive directory (or linked from the store)
 #          a <configuration.json> file is created
 def createArchivedDataset(archDir, # COMPULSORY
                           statepoint = "not specified", 
@@ -85,37 +284,420 @@ def createArchivedDataset(archDir, # COMPULSORY
                           surfaceSource='surface_source.h5',
                           comment = "MyComment", 
                           source = "not specified", sourcePara = { },
-                          geometry = "not specified", geometryPara = { }):
-    myFile='model.xml'
-    archiveFile(archDir, myFile)
-    myFile='summary.h5'
-    archiveFile(archDir, myFile)
-    myFile=surfaceSource
-    archiveFile(archDir, myFile)
+                          geometry = "not specified", geometryPara = { },
+                          store = None, catalog = None):
     a=str(statepoint);statepoint_str=a.rsplit('/',1)[1]
-    archiveFile(archDir, statepoint_str)
+    hashes = {}
+    for myFile in ['model.xml', 'summary.h5', surfaceSource, statepoint_str]:
+        if store is None:
+            archiveFile(archDir, myFile)
+        else:
+            hashes[myFile] = archiveFileToStore(archDir, myFile, store)
     # saving the script
-    shutil.copy(script, archDir+script)
+    if not os.path.exists(script):
+        print("The script "+script+" does not exist")
+    elif store is None:
+        shutil.copy(script, archDir+script)
+    else:
+        hashes[script] = archiveFileToStore(archDir, script, store, move=False)
     
     # add the creation of a <configuration.json> file
     # configuration = { 'script': script, 'surfaceWrite':surfaceSource, 'statePoint': statepoint_str,
                    # 'source':source, 'geometry':geometry} 
+    sourcePara, geometryPara = plainParameters(sourcePara), plainParameters(geometryPara)
     configuration = { 'comment': comment,
                      'files': {'script': script, 'surfaceWrite':surfaceSource, 'statePoint': statepoint_str },
                      'source':{ 'sourceName':source,'sourceParameters':sourcePara }, 
                      'geometry': { 'geometryName':geometry, 'geometryParameters':geometryPara}
                     } 
+    if store is not None:
+        configuration['files']['store'] = os.path.abspath(store)
+        configuration['files']['hashes'] = hashes
     # print(configuration)
     
-    with open('configuration.json','w') as f:
+    # written directly in the archive directory (no file shared between the jobs in the current directory)
+    tmpFile = os.path.join(archDir, '.configuration.json.tmp')
+    with open(tmpFile, 'w') as f:
         json.dump(configuration,f)
-        archiveFile(archDir, 'configuration.json')
+    os.replace(tmpFile, os.path.join(archDir, 'configuration.json'))
+    if catalog:
+        catalogRun(archDir, catalog)
+
+# INPUT : the staging directory of an archive that failed (see archiveRun)
+# OUTPUT : the files moved into it are moved back to the current directory, the copies (script) and the
+#          configuration are deleted ; the staging directory is removed when empty, otherwise its path is printed
+def restoreStaging(stagingDir):
+    for name in os.listdir(stagingDir):
+        path = os.path.join(stagingDir, name)
+        try:
+            if name in ('configuration.json', '.configuration.json.tmp'):
+                os.remove(path)
+            elif not os.path.exists(name):
+                shutil.move(path, name)
+            elif os.path.isfile(name) and filecmp.cmp(path, name, shallow=False):
+                os.remove(path)
+        except OSError as error:
+            print("The file "+path+" could not be restored ("+str(error)+")")
+    try:
+        os.rmdir(stagingDir)
+    except OSError:
+        print("The failed archive is kept in "+stagingDir)
+
+# INPUT : the directory in which the archive is created (current directory by default), the files to archive
+#         being in the current directory as for createArchivedDataset (it may be on another file system than root,
+#         the files are then copied), the other arguments of createArchivedDataset
+#         catalog : a run catalog to update, None by default : SQLite locking is not reliable on parallel file
+#         systems (Lustre, GPFS) and all the jobs would wait for the same file, run rebuildCatalog(root, catalog)
+#         once the jobs are done instead
+# OUTPUT : the archive directory root/run_date_time_.../, safe with many jobs archiving at the same time :
+#          the run is assembled in a hidden staging directory of root (same file system) then renamed at once,
+#          so an archive directory is either complete or absent ; on an error the files are moved back to the
+#          current directory (restoreStaging) ; a failure of the catalog is printed, the run stays archived
+def archiveRun(root = '.', statepoint = "not specified", catalog = None, **arguments):
+    name = runId()
+    stagingDir = os.path.join(root, "." + name) + "/"
+    os.mkdir(stagingDir)
+    try:
+        createArchivedDataset(stagingDir, statepoint=statepoint, catalog=None, **arguments)
+        archDir = os.path.join(root, name) + "/"
+        os.rename(stagingDir, archDir)
+    except BaseException:
+        restoreStaging(stagingDir)
+        raise
+    if catalog:
+        try:
+            catalogRun(archDir, catalog)
+        except (sqlite3.Error, OSError) as error:
+            print("The run "+archDir+" is archived but not in the catalog "+catalog+" ("+str(error)+"), see rebuildCatalog")
+    return archDir
          
         
+# Background archiving
+# createArchivedDatasetAsync moves the files of the run at once (renames, so that the next model.run can start),
+# then repacks the large HDF5 datasets (source_bank, tallies...) with chunked gzip compression in a background
+# thread and writes archDir/ARCHIVE_COMPLETE when it is done
+#  > createArchivedDatasetAsync(archDir, statepoint=sp_filename, script="scan.ipynb", source="Be40") ; model.run() ...
+#  > waitArchives() # before reading the archives, also done at the exit of python
+_archiveExecutor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+_archiveFutures = []
+
+# INPUT : a HDF5 file, the compression, the minimal size (bytes) of the datasets to compress
+# OUTPUT : the file is rewritten with its large datasets chunked and compressed, copied by slices of about 64MB
+def repackHDF5(fileName, compression = 'gzip', level = 4, minSize = 1 << 20):
+    tmpFile = fileName + '.repack.tmp'
+    with h5py.File(fileName, 'r') as src, h5py.File(tmpFile, 'w') as dst:
+        dst.attrs.update(src.attrs)
+        def copyItem(name, item):
+            if isinstance(item, h5py.Group):
+                dst.require_group(name).attrs.update(item.attrs)
+            elif item.ndim == 0 or item.nbytes < minSize:
+                src.copy(item, dst, name)
+            else:
+                dset = dst.create_dataset(name, shape=item.shape, dtype=item.dtype, chunks=True,
+                                          compression=compression, compression_opts=level, shuffle=True)
+                dset.attrs.update(item.attrs)
+                rows = max(1, (64 << 20) // max(1, item.nbytes // item.shape[0]))
+                for start in range(0, item.shape[0], rows):
+                    dset[start:start + rows] = item[start:start + rows]
+        src.visititems(copyItem)
+    os.replace(tmpFile, fileName)
+
+def finishArchive(archDir, files, compress, catalog = None):
+    sizes = {}
+    for myFile in files:
+        path = os.path.join(archDir, myFile)
+        if not os.path.exists(path):
+            continue
+        before = os.path.getsize(path)
+        if compress and h5py.is_hdf5(path):
+            repackHDF5(path)
+        sizes[myFile] = [before, os.path.getsize(path)]
+    with open(os.path.join(archDir, 'ARCHIVE_COMPLETE'), 'w') as f:
+        json.dump({'sizes': sizes, 'completed': datetime.datetime.now().isoformat()}, f)
+    if catalog:
+        catalogRun(archDir, catalog)
+    return archDir
+
+# INPUT : as createArchivedDataset, compress=False to only write the completion marker in the background
+# OUTPUT : a concurrent.futures.Future, its result is archDir once the archive is complete
+#          (no compression with a store : the stored files are shared and read-only)
+#          the run is added to the catalog by the background task, after the compression (hashes of the final files)
+def createArchivedDatasetAsync(archDir, statepoint = "not specified", surfaceSource = 'surface_source.h5',
+                               compress = True, **arguments):
+    catalog = arguments.pop('catalog', None) # recorded in the background, once the files are compressed
+    createArchivedDataset(archDir, statepoint=statepoint, surfaceSource=surfaceSource, catalog=None, **arguments)
+    files = [surfaceSource, str(statepoint).rsplit('/', 1)[1]]
+    future = _archiveExecutor.submit(finishArchive, archDir, files, compress and arguments.get('store') is None,
+                                     catalog and os.path.abspath(catalog))
+    _archiveFutures.append(future)
+    return future
+
+# OUTPUT : waits for the background archives, returns their directories
+def waitArchives():
+    done = [future.result() for future in _archiveFutures]
+    _archiveFutures.clear()
+    return done
+
+# INPUT : a grid of parameters, either a dictionary of lists {'e0':[20,26,30], 'r':[1,2]} (all the combinations)
+#         or a list of dictionaries (one per point)
+# OUTPUT : the list of the points of the scan (dictionaries), numpy values (np.arange, np.linspace...) converted
+#          to python numbers so that they can be saved in configuration.json
+def scanPoints(grid):
+    if isinstance(grid, dict):
+        names = list(grid)
+        points = [dict(zip(names, values)) for values in itertools.product(*grid.values())]
+    else:
+        points = [dict(point) for point in grid]
+    return [plainParameters(point) for point in points]
+
+# INPUT : a dictionary of parameters
+# OUTPUT : the same with the numpy scalars converted to python numbers
+def plainParameters(parameters):
+    return {name: value.item() if isinstance(value, np.generic) else value for name, value in parameters.items()}
+
+# runs one point of a scan in its own directory and archives it there (in a worker process)
+def runScanPoint(buildModel, parameters, runDir, threads, script, archiveArguments, parameterKind, fixedParameters):
+    os.makedirs(runDir, exist_ok=True)
+    scriptName = os.path.basename(script)
+    if os.path.exists(script):
+        shutil.copy(script, os.path.join(runDir, scriptName))
+    cwd = os.getcwd()
+    os.chdir(runDir)
+    try:
+        model = buildModel(**parameters)
+        statepoint = os.path.abspath(str(model.run(threads=threads)))
+        archDir = archiveRun(statepoint=statepoint, script=scriptName,
+                             **{parameterKind + 'Para': {**fixedParameters, **parameters}}, **archiveArguments)
+        return parameters, os.path.join(runDir, os.path.normpath(archDir)) + "/"
+    finally:
+        os.chdir(cwd)
+
+# INPUT : buildModel, a function returning the openmc.Model of a point, called as buildModel(**parameters)
+#         (defined in a module, not in the notebook, so that it can be sent to the worker processes)
+#         grid, the parameters of the scan (see scanPoints)
+#         processes, the number of simultaneous runs; threads, the OpenMC threads of each run (cpu count / processes by default)
+#         workDir, each point runs in its own directory workDir/scan_<i>/ so that model.xml, summary.h5... do not clash
+#         parameterKind, 'geometry' or 'source' : where the parameters of the points are saved in configuration.json,
+#         with the fixed parameters of the same kind (geometryPara or sourcePara, the point wins on a common name)
+#         script, comment, source, sourcePara, geometry, geometryPara, store, catalog : as for createArchivedDataset
+#         (a catalog is shared by all the points, relative to the current directory)
+# OUTPUT : the list of (parameters, archive directory) of the points, each one archived in workDir/scan_<i>/run_date_time/
+def runScan(buildModel, grid, processes = 1, threads = None, workDir = '.',
+            script = "not specified", comment = "MyComment",
+            source = "not specified", sourcePara = { },
+            geometry = "not specified", geometryPara = { }, parameterKind = 'geometry', store = None,
+            catalog = None):
+    points = scanPoints(grid)
+    if threads is None:
+        threads = max(1, (os.cpu_count() or 1) // processes)
+    archiveArguments = {'comment': comment, 'source': source, 'geometry': geometry,
+                        'store': None if store is None else os.path.abspath(store),
+                        'catalog': catalog and os.path.abspath(catalog)}
+    sourcePara, geometryPara = plainParameters(sourcePara), plainParameters(geometryPara)
+    archiveArguments['sourcePara' if parameterKind == 'geometry' else 'geometryPara'] = (
+        sourcePara if parameterKind == 'geometry' else geometryPara)
+    fixedParameters = geometryPara if parameterKind == 'geometry' else sourcePara
+    arguments = [(buildModel, point, os.path.join(workDir, f"scan_{i}"), threads, os.path.abspath(script),
+                  archiveArguments, parameterKind, fixedParameters) for i, point in enumerate(points)]
+    if processes == 1:
+        return [runScanPoint(*a) for a in arguments]
+    with concurrent.futures.ProcessPoolExecutor(max_workers=processes) as executor:
+        futures = [executor.submit(runScanPoint, *a) for a in arguments]
+        return [future.result() for future in futures]
+
+# Cache of the tallies of the archived runs
+# the tallies are extracted once from the statepoint into archDir/tallies/ (memory-mappable .npy files),
+# then read back without parsing the statepoint, its summary or the tally metadata
+#  > cacheTallies(archDir) ; tally = loadTally(archDir, "mixte") ; tally['mean']
+#  > tallies = loadTallies("run_*", "mixte", threads=16)
+
+# writes a file of the tally cache under a temporary name then renames it, a concurrent loadTally never
+# reads a half-written file
+def writeAtomic(fileName, write):
+    tmpFile = f"{fileName}.{runId()}.tmp"
+    with open(tmpFile, 'wb') as f:
+        write(f)
+    os.replace(tmpFile, fileName)
+
+# INPUT : the archive directory, the names of the tallies to extract (all of them by default)
+# OUTPUT : archDir/tallies/tally_<id>.mean.npy, .std_dev.npy (shape of get_reshaped_data),
+#          tally_<id>.filter<i>.npy (bins of each filter) and index.json describing them by tally name
+#          (with names, merged with the index of the tallies cached before)
+def cacheTallies(archDir, names = None):
+    import openmc # only here : archiving and querying the runs do not need openmc
+    with open(os.path.join(archDir, 'configuration.json')) as f:
+        statepoint = json.load(f)['files']['statePoint']
+    tallyDir = os.path.join(archDir, 'tallies')
+    os.makedirs(tallyDir, exist_ok=True)
+    indexFile = os.path.join(tallyDir, 'index.json')
+    index = {}
+    if names is not None and os.path.exists(indexFile): # the tallies cached before are kept
+        with open(indexFile) as f:
+            index = json.load(f)
+    with openmc.StatePoint(os.path.join(archDir, statepoint), autolink=False) as sp:
+        for tally in sp.tallies.values():
+            name = tally.name or f"tally_{tally.id}"
+            if names is not None and name not in names:
+                continue
+            prefix = f"tally_{tally.id}"
+            for value in ('mean', 'std_dev'):
+                data = tally.get_reshaped_data(value=value)
+                writeAtomic(os.path.join(tallyDir, f"{prefix}.{value}.npy"), lambda f: np.save(f, data))
+            filters = []
+            for i, tallyFilter in enumerate(tally.filters):
+                bins = np.asarray(tallyFilter.bins)
+                binsFile = None
+                if bins.dtype != object:
+                    binsFile = f"{prefix}.filter{i}.npy"
+                    writeAtomic(os.path.join(tallyDir, binsFile), lambda f: np.save(f, bins))
+                filters.append({'type': type(tallyFilter).__name__, 'bins': binsFile})
+            index[name] = {'id': tally.id, 'prefix': prefix, 'scores': list(tally.scores),
+                           'nuclides': [str(nuclide) for nuclide in tally.nuclides], 'filters': filters}
+    writeAtomic(indexFile, lambda f: f.write(json.dumps(index).encode()))
+    return index
+
+# INPUT : the archive directory and the name of a tally (cacheTallies is called first if needed)
+# OUTPUT : a dictionary {'mean', 'std_dev' : memory-mapped arrays, 'filters' : [(filter type, bins)], 'scores', 'nuclides'}
+def loadTally(archDir, name):
+    tallyDir = os.path.join(archDir, 'tallies')
+    indexFile = os.path.join(tallyDir, 'index.json')
+    index = {}
+    if os.path.exists(indexFile):
+        with open(indexFile) as f:
+            index = json.load(f)
+    if name not in index:
+        index = cacheTallies(archDir)
+    entry = index[name]
+    load = lambda fileName: np.load(os.path.join(tallyDir, fileName), mmap_mode='r')
+    return {'mean': load(entry['prefix'] + '.mean.npy'),
+            'std_dev': load(entry['prefix'] + '.std_dev.npy'),
+            'filters': [(f['type'], load(f['bins']) if f['bins'] else None) for f in entry['filters']],
+            'scores': entry['scores'], 'nuclides': entry['nuclides']}
+
+# INPUT : a list of archive directories (or a glob pattern "run_*"), the name of a tally, the number of threads
+# OUTPUT : the list of loadTally results, in the order of the directories
+def loadTallies(archDirs, name, threads = 8):
+    if isinstance(archDirs, str):
+        archDirs = sorted(glob.glob(archDirs))
+    with concurrent.futures.ThreadPoolExecutor(max_workers=threads) as executor:
+        return list(executor.map(lambda archDir: loadTally(archDir, name), archDirs))
+
+# INPUT : a list of archive directories (or a glob pattern), the number of processes
+# OUTPUT : the tallies of all the runs are cached (cacheTallies), in parallel
+def cacheAllTallies(archDirs, processes = None):
+    if isinstance(archDirs, str):
+        archDirs = sorted(glob.glob(archDirs))
+    with concurrent.futures.ProcessPoolExecutor(max_workers=processes) as executor:
+        return list(executor.map(cacheTallies, archDirs))
+
+# Packed archives (shards)
+# a batch of runs in a single uncompressed tar file <shard>.tar, each run as a folder run_.../ of members,
+# with an index <shard>.tar.index.json {member : [offset, size]} : 2 files on the file system instead of
+# thousands, and any member readable in place (random access, no unpacking), HDF5 files included
+#  > packShard(glob.glob("run_*"), "shard_000.tar", remove=True)
+#  > readConfiguration("shard_000.tar", "run_20240101_120000_...")
+#  > f = h5py.File(openShardMember("shard_000.tar", "run_.../statepoint.10.h5"), 'r')
+# the catalog only records run directories (rebuildCatalog after packing with remove=True)
+
+# INPUT : a list of archive directories (or a glob pattern), the shard file,
+#         remove=True to delete the directories once packed
+# OUTPUT : the shard and its index are written (renamed into place when complete), the index is returned
+#          the files are streamed one by one, links (content-addressed store) are stored as plain files
+def packShard(archDirs, shardFile, remove = False):
+    if isinstance(archDirs, str):
+        archDirs = sorted(glob.glob(archDirs))
+    tmpFile = f"{shardFile}.{runId()}.tmp"
+    with tarfile.open(tmpFile, 'w', format=tarfile.PAX_FORMAT) as tar:
+        for archDir in archDirs:
+            runName = os.path.basename(os.path.normpath(archDir))
+            for directory, subDirs, fileNames in os.walk(archDir):
+                subDirs.sort()
+                for fileName in sorted(fileNames):
+                    path = os.path.join(directory, fileName)
+                    info = tarfile.TarInfo(runName + "/" + os.path.relpath(path, archDir).replace(os.sep, "/"))
+                    info.size = os.path.getsize(path)
+                    info.mtime = int(os.path.getmtime(path))
+                    info.mode = 0o644
+                    with open(path, 'rb') as f:
+                        tar.addfile(info, f)
+    with tarfile.open(tmpFile, 'r') as tar:
+        index = {member.name: [member.offset_data, member.size] for member in tar if member.isfile()}
+    with open(tmpFile + '.index.json', 'w') as f:
+        json.dump(index, f)
+    os.replace(tmpFile + '.index.json', shardFile + '.index.json')
+    os.replace(tmpFile, shardFile)
+    if remove:
+        for archDir in archDirs:
+            shutil.rmtree(archDir)
+    return index
+
+# INPUT : a shard file
+# OUTPUT : its index {member : [offset, size]}
+def shardIndex(shardFile):
+    with open(shardFile + '.index.json') as f:
+        return json.load(f)
+
+# INPUT : a shard file
+# OUTPUT : the names of the runs it contains
+def shardRuns(shardFile):
+    return sorted({name.split('/', 1)[0] for name in shardIndex(shardFile)})
+
+# read-only file object over one member of a shard (the bytes offset..offset+size of the tar file)
+class ShardMember(io.RawIOBase):
+    def __init__(self, shardFile, offset, size):
+        self.file = open(shardFile, 'rb')
+        self.offset, self.size, self.position = offset, size, 0
+    def readable(self):
+        return True
+    def seekable(self):
+        return True
+    def tell(self):
+        return self.position
+    def seek(self, position, whence = io.SEEK_SET):
+        base = {io.SEEK_SET: 0, io.SEEK_CUR: self.position, io.SEEK_END: self.size}[whence]
+        self.position = max(0, base + position)
+        return self.position
+    def readinto(self, buffer):
+        n = max(0, min(len(buffer), self.size - self.position))
+        self.file.seek(self.offset + self.position)
+        n = self.file.readinto(memoryview(buffer)[:n])
+        self.position += n
+        return n
+    def close(self):
+        self.file.close()
+        super().close()
+
+# INPUT : a shard file, the name of a member "run_.../file" (as in the index)
+# OUTPUT : a (buffered) read-only file object of the member, to be given to json.load, np.load, h5py.File(..., 'r')...
+def openShardMember(shardFile, member, index = None):
+    offset, size = (index or shardIndex(shardFile))[member]
+    return io.BufferedReader(ShardMember(shardFile, offset, size), buffer_size=1 << 20)
+
+# INPUT : a shard file, the name of a run
+# OUTPUT : the configuration of the run (content of its configuration.json)
+def readConfiguration(shardFile, runName):
+    with openShardMember(shardFile, runName + '/configuration.json') as f:
+        return json.load(f)
+
 # EXAMPLE
 # from openmc_archiving import *
 # archDir=createArchiveDirectory() # this creates a new folder "./run_date_time" in the working script directory
 # createArchivedDataset(archDir,statepoint=sp_filename, script="modules_testing_V1.ipynb",
-#                       comment="essai n°3", source="Neutron 25MeV", geometry="Baseline_V1", geometryPara={'e0':26} 
-                          
-        
+#                       comment="essai n°3", source="Neutron 25MeV", geometry="Baseline_V1", geometryPara={'e0':26}
+
+# EXAMPLE in a job of a cluster array (each job in its own working directory), all the runs archived in one place
+# from openmc_archiving import archiveRun
+# archDir = archiveRun(root="/scratch/icone/runs", statepoint=sp_filename, script="job.py",
+#                      source="Neutron 25MeV", geometry="Baseline_V1", geometryPara={'e0':26})
+# then, once all the jobs are done : rebuildCatalog("/scratch/icone/runs", "/scratch/icone/runs/run_catalog.sqlite")
+
+# EXAMPLE of a query of the catalog, then loading a tally of the matching runs
+# from openmc_archiving import queryRuns, loadTally
+# runs = queryRuns(geometry="Baseline_V1", e0=(20, 30))
+# tallies = [loadTally(run['path'], "mixte") for run in runs]
+
+# EXAMPLE of a scan, buildModel(e0) being defined in a module (mygeometry.py)
+# from openmc_archiving import runScan
+# from mygeometry import buildModel
+# runs = runScan(buildModel, {'e0': [20, 26, 30]}, processes=3, script="scan_e0.ipynb",
+#                source="Neutron 25MeV", geometry="Baseline_V1")
@@ -4,8 +4,26 @@
 #     >settings.surf_source_write=dict(surface_ids= [planeE.id], max_particles= 100000000)  
 # Available functions
 #  > particles=read_surface_source("surface_source.h5")  , default filename
+#  > columns=read_surface_source("surface_source.h5", fields=['E','u.z']) , only reads E and u.z
+#  > columns=read_surface_source("surface_source.h5", fields=['E','u.z'], cache=True) , memory-mapped columnar cache
 #  > N_flux=get_flux(particles,0.1,5) , neutrons emitted with E<0.1 and angle wrt Oz < 5°
+#  > sel= energy_range(Emax=0.1) & cone(5) & on_surface(12) , vectorized selections combined with & | ~
+#  > N_sel= select(particles, sel)
+#  > for chunk in iter_surface_source("surface_source.h5", chunk_size=1000000): ... , bounded memory
+#  > N= count("surface_source.h5", sel) , also weighted_sum() and histogram(), streamed over the file
+#  > results= classify(particles, SUMMARY_CATEGORIES) , counts and weights of several categories in one pass
+#  > index= SourceIndex("surface_source.h5") , get_flux(particles,0,0.1,5,index=index) by binary search
+#  > rows= aggregate_runs("run_*", SUMMARY_CATEGORIES, processes=8) , same cuts on many archived runs in parallel
+#  > thin_surface_source("surface_source.h5", "surface_source_thinned.h5", survival, selection) , weighted reduced source
+#  > parts= partition(particles) , {(surf_id, particle): array} in one pass, partition_surface_source() for files
+#  > XY= Histogram(['r.x','r.y'], [binsX, binsY], selection).fill("surface_source.h5") , mergeable 1D/2D/3D maps
     
+import os
+import glob
+import json
+import shutil
+import hashlib
+import concurrent.futures
 import numpy as np
 import h5py
 
@@ -23,11 +41,130 @@ source_dtype = np.dtype([
 
 # filename = "surface_source.h5" # non par défaut du fichier source
 
-def read_surface_source(filename="surface_source.h5"):
+# compound type holding only the requested fields ('E', 'u.z', ...) of source_dtype
+# HDF5 converts the records by member names so only these fields are copied from the file
+def _projected_dtype(fields):
+    members = {}
+    for name in fields:
+        head, _, tail = name.partition('.')
+        if not tail:
+            members[head] = None
+        elif head not in members:
+            members[head] = [tail]
+        elif members[head] is not None and tail not in members[head]:
+            members[head].append(tail)
+    return np.dtype([(head, source_dtype[head] if tails is None else np.dtype([(t, pos_dtype[t]) for t in tails]))
+                     for head, tails in members.items()])
+
+# the particles are read directly into their final array (no intermediate copy)
+# fields=['E','u.z'] only reads these fields and returns a dict of arrays {'E': ..., 'u.z': ...}
+# cache=True reads the bank from its columnar cache (see below), written on the first read
+def read_surface_source(filename="surface_source.h5", fields=None, cache=False, cache_hash=False):
+    if cache:
+        return _read_cache(filename, fields, cache_hash)
+    dtype = source_dtype if fields is None else _projected_dtype(fields)
+    with h5py.File(filename, "r") as f:
+        dset = f["source_bank"]
+        particles = np.empty(dset.shape, dtype=dtype)
+        if particles.size:
+            dset.read_direct(particles)
+    if fields is None:
+        return particles
+    return {name: get_field(particles, name) for name in fields}
+
+# chunked reading of the bank: yields arrays of at most chunk_size particles
+# read in place in a single buffer, so memory stays bounded whatever the file size
+# (the buffer is reused, copy a chunk to keep it after the next iteration)
+#  > for chunk in iter_surface_source("surface_source.h5", chunk_size=1000000): ...
+# with fields=[...] each chunk is a dict of arrays as for read_surface_source
+def iter_surface_source(filename="surface_source.h5", chunk_size=1000000, fields=None):
+    dtype = source_dtype if fields is None else _projected_dtype(fields)
     with h5py.File(filename, "r") as f:
-        particles= np.array(f["source_bank"][()], dtype=source_dtype)
-    return particles
+        dset = f["source_bank"]
+        n = dset.shape[0]
+        buffer = np.empty(min(chunk_size, n), dtype=dtype)
+        for start in range(0, n, chunk_size):
+            stop = min(start + chunk_size, n)
+            chunk = buffer[:stop - start]
+            dset.read_direct(chunk, source_sel=np.s_[start:stop], dest_sel=np.s_[0:stop - start])
+            yield chunk if fields is None else {name: get_field(chunk, name) for name in fields}
    
+# Columnar cache of a bank: one memory-mappable .npy per field in "surface_source.cache/"
+# written on the first read with cache=True, then reused as long as the file size and mtime
+# (and its sha1 with cache_hash=True) are unchanged, otherwise it is rebuilt
+#  > columns= read_surface_source("surface_source.h5", fields=['E','u.z'], cache=True) , memory-mapped arrays
+#  > particles= read_surface_source("surface_source.h5", cache=True) , full bank assembled from the columns
+CACHE_FIELDS = ['r.x', 'r.y', 'r.z', 'u.x', 'u.y', 'u.z', 'E', 'time', 'wgt', 'delayed_group', 'surf_id', 'particle']
+
+def _file_signature(filename, hash=False):
+    stat = os.stat(filename)
+    signature = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+    if hash:
+        sha1 = hashlib.sha1()
+        with open(filename, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 24), b''):
+                sha1.update(block)
+        signature['sha1'] = sha1.hexdigest()
+    return signature
+
+def _cache_dir(filename):
+    return os.path.splitext(filename)[0] + ".cache"
+
+def _build_cache(filename, signature, chunk_size=1000000):
+    cache_dir = _cache_dir(filename)
+    tmp_dir = cache_dir + ".tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    with h5py.File(filename, "r") as f:
+        n = f["source_bank"].shape[0]
+    empty = np.zeros(0, dtype=source_dtype)
+    columns = {name: np.lib.format.open_memmap(os.path.join(tmp_dir, name + ".npy"), mode='w+',
+                                               dtype=get_field(empty, name).dtype, shape=(n,))
+               for name in CACHE_FIELDS}
+    start = 0
+    for chunk in iter_surface_source(filename, chunk_size):
+        for name, column in columns.items():
+            column[start:start + len(chunk)] = get_field(chunk, name)
+        start += len(chunk)
+    for column in columns.values():
+        column.flush()
+    del columns
+    with open(os.path.join(tmp_dir, "signature.json"), "w") as f:
+        json.dump(signature, f)
+    shutil.rmtree(cache_dir, ignore_errors=True)
+    os.rename(tmp_dir, cache_dir)
+
+def _read_cache(filename, fields=None, cache_hash=False):
+    cache_dir = _cache_dir(filename)
+    signature = _file_signature(filename, cache_hash)
+    try:
+        with open(os.path.join(cache_dir, "signature.json")) as f:
+            cached = json.load(f)
+    except (FileNotFoundError, ValueError):
+        cached = {}
+    if any(cached.get(key) != value for key, value in signature.items()):
+        _build_cache(filename, signature)
+    load = lambda name: np.load(os.path.join(cache_dir, name + ".npy"), mmap_mode='r')
+    if fields is None:
+        columns = {name: load(name) for name in CACHE_FIELDS}
+        particles = np.empty(len(columns['E']), dtype=source_dtype)
+        for name, column in columns.items():
+            head, _, tail = name.partition('.')
+            if tail:
+                particles[head][tail] = column
+            else:
+                particles[head] = column
+        return particles
+    columns = {}
+    for name in fields:
+        if name in ('r', 'u'): # position or direction as a pos_dtype array
+            columns[name] = np.empty(len(load('E')), dtype=pos_dtype)
+            for c in 'xyz':
+                columns[name][c] = load(name + '.' + c)
+        else:
+            columns[name] = load(name)
+    return columns
+
 def is_fast(ruetwdsp):
     (r,u,e,t,w,d,s,p) = ruetwdsp
     return e > 0.1
@@ -56,34 +193,490 @@ def is_emitted_in_angle(ruetwdsp,Emin,Emax,angle): # E is the max energy, angle
     (r,u,e,t,w,d,s,p) = ruetwdsp
     return (e>Emin) and (e < Emax) and (u[2] > np.cos(angle*np.pi/180))  
 
+# Vectorized selections
+# A Selection is a boolean mask on the fields of source_dtype, evaluated in a single pass over the array
+# Selections are combined with & (and), | (or) and ~ (not), for instance
+#  > sel= energy_range(Emin=0, Emax=0.1) & cone(5, axis=(0,0,1)) & particle_type('neutron')
+#  > N_sel= select(particles, sel)  # or sel.mask(particles) to get the boolean mask only
+# A Selection only holds plain data (no lambda) so it can be sent to worker processes
+
+PARTICLE_IDS = {'neutron': 0, 'photon': 1, 'electron': 2, 'positron': 3} # openmc ParticleType
+
+# field of a bank given by its name, 'E', 'wgt', ... or 'r.x', 'u.z' for the components of r and u
+# works on a structured array of source_dtype as well as on a dict of columns
+def get_field(particles, name):
+    names = particles.keys() if isinstance(particles, dict) else particles.dtype.names
+    if name in names:
+        return particles[name]
+    head, _, tail = name.partition('.')
+    return particles[head][tail]
+
+def _size(particles):
+    if isinstance(particles, dict):
+        return len(next(iter(particles.values())))
+    return len(particles)
+
+class Selection:
+    def __init__(self, kind, *args):
+        self.kind = kind
+        self.args = args
+
+    # cache : dict shared by the selections evaluated on the same particles,
+    #         the sub-selections they have in common are then computed once
+    def mask(self, particles, cache=None):
+        if cache is None:
+            return self._evaluate(particles, None)
+        key = repr(self)
+        if key not in cache:
+            cache[key] = self._evaluate(particles, cache)
+        return cache[key]
+
+    def _evaluate(self, particles, cache):
+        kind, args = self.kind, self.args
+        if kind == 'all':
+            return np.ones(_size(particles), dtype=bool)
+        if kind == 'and':
+            return args[0].mask(particles, cache) & args[1].mask(particles, cache)
+        if kind == 'or':
+            return args[0].mask(particles, cache) | args[1].mask(particles, cache)
+        if kind == 'not':
+            return ~args[0].mask(particles, cache)
+        if kind == 'range': # vmin < field < vmax, None for no bound
+            field, vmin, vmax = args
+            values = get_field(particles, field)
+            mask = np.ones(len(values), dtype=bool)
+            if vmin is not None:
+                mask &= values > vmin
+            if vmax is not None:
+                mask &= values < vmax
+            return mask
+        if kind == 'cone': # u.axis > cos_min, only the non-zero components of axis are read
+            axis, cos_min = args
+            dot = sum(a * get_field(particles, 'u.' + c) for a, c in zip(axis, 'xyz') if a != 0)
+            return dot > cos_min
+        if kind == 'in': # integer field among a list of values
+            field, values = args
+            return np.isin(get_field(particles, field), values)
+        raise ValueError(f"unknown selection kind '{kind}'")
+
+    def __and__(self, other):
+        return Selection('and', self, other)
+
+    def __or__(self, other):
+        return Selection('or', self, other)
+
+    def __invert__(self):
+        return Selection('not', self)
+
+    def __repr__(self):
+        if self.kind in ('and', 'or'):
+            return f"({self.args[0]!r} {'&' if self.kind == 'and' else '|'} {self.args[1]!r})"
+        if self.kind == 'not':
+            return f"~{self.args[0]!r}"
+        return f"{self.kind}{self.args!r}"
+
+def all_particles():
+    return Selection('all')
+
+def field_range(field, vmin=None, vmax=None):
+    return Selection('range', field, vmin, vmax)
+
+# energies in eV as in the OpenMC bank (E<0.1 is E<100meV), vmin < E < vmax
+def energy_range(Emin=None, Emax=None):
+    return field_range('E', Emin, Emax)
+
+# particles emitted within angle (degrees) around axis (default Oz)
+def cone(angle, axis=(0., 0., 1.)):
+    axis = np.asarray(axis, dtype=float)
+    axis = tuple((axis / np.linalg.norm(axis)).tolist())
+    return Selection('cone', axis, float(np.cos(angle*np.pi/180)))
+
+def upward():
+    return field_range('u.z', vmin=0)
+
+def downward():
+    return field_range('u.z', vmax=0)
+
+def on_surface(*surf_ids):
+    return Selection('in', 'surf_id', list(surf_ids))
+
+# particle given by its name ('neutron', 'photon', ...) or its openmc id
+def particle_type(*particles):
+    return Selection('in', 'particle', [PARTICLE_IDS.get(p, p) for p in particles])
+
+def in_box(xmin=None, xmax=None, ymin=None, ymax=None):
+    return field_range('r.x', xmin, xmax) & field_range('r.y', ymin, ymax)
+
+# the particles of the bank passing a selection (a copy, as with np.fromiter)
+def select(particles, selection):
+    mask = selection.mask(particles)
+    if isinstance(particles, dict):
+        return {name: values[mask] for name, values in particles.items()}
+    return particles[mask]
+
+# Out-of-core reductions
+# source is a bank in memory, an iterable of chunks (iter_surface_source) or a file name, streamed chunk by chunk
+#  > N_cold= count("surface_source.h5", energy_range(Emax=0.005))
+#  > spectrum, edges= histogram("surface_source.h5", 'E', np.logspace(-5, 8, 131), cone(5))
+
+def _chunks(source):
+    if isinstance(source, str):
+        return iter_surface_source(source)
+    if isinstance(source, (np.ndarray, dict)):
+        return (source,)
+    return source
+
+def count(source, selection=None):
+    selection = selection or all_particles()
+    return sum(int(np.count_nonzero(selection.mask(chunk))) for chunk in _chunks(source))
+
+# sum of a field (the statistical weight by default) over the selected particles
+def weighted_sum(source, selection=None, field='wgt'):
+    selection = selection or all_particles()
+    total = 0.
+    for chunk in _chunks(source):
+        total += float(get_field(chunk, field)[selection.mask(chunk)].sum())
+    return total
+
+# 1D histogram of a field over fixed bin edges, weighted by wgt unless weighted=False
+def histogram(source, field, bins, selection=None, weighted=True):
+    h = Histogram([field], [bins], selection, weighted).fill(source)
+    return h.hist, h.bins[0]
+
+# Histograms accumulated chunk by chunk, 1D/2D/3D, with arbitrary bin edges and wgt weighting
+# partial histograms (chunks, files, worker processes) with the same fields and bins are merged with + or +=
+#  > spot= Histogram(['r.x','r.y'], [np.linspace(-0.3,0.3,25), np.linspace(-0.2,0.2,13)], energy_range(Emax=0.005))
+#  > spot.fill("surface_source.h5") ; XY= spot.hist.T
+#  > EC= Histogram(['E','u.z'], [np.logspace(-5,8,131), sine_bins(30)]).fill(particles)
+#  > ET= Histogram(['E','time'], [np.logspace(-5,8,131), np.linspace(0,1e-3,101)])
+class Histogram:
+    def __init__(self, fields, bins, selection=None, weighted=True):
+        self.fields = list(fields)
+        self.bins = [np.asarray(edges, dtype=float) for edges in bins]
+        if len(self.bins) != len(self.fields):
+            raise ValueError("one array of bin edges is needed per field")
+        self.selection = selection or all_particles()
+        self.weighted = weighted
+        self.hist = np.zeros([len(edges) - 1 for edges in self.bins])
+
+    def fill(self, source):
+        for chunk in _chunks(source):
+            mask = self.selection.mask(chunk)
+            sample = [get_field(chunk, field)[mask] for field in self.fields]
+            weights = get_field(chunk, 'wgt')[mask] if self.weighted else None
+            self.hist += np.histogramdd(sample, bins=self.bins, weights=weights)[0]
+        return self
+
+    def merge(self, other):
+        if self.fields != other.fields or not all(np.array_equal(a, b) for a, b in zip(self.bins, other.bins)):
+            raise ValueError("histograms with different fields or bins cannot be merged")
+        self.hist += other.hist
+        return self
+
+    def __iadd__(self, other):
+        return self.merge(other)
+
+    def __add__(self, other):
+        total = Histogram(self.fields, self.bins, self.selection, self.weighted)
+        total.hist = self.hist.copy()
+        return total.merge(other)
+
+# sine-spaced bins of the beam-spot maps, sin(angle) for angle in [-angle_max, angle_max] degrees
+def sine_bins(angle_max=30, num=61):
+    return np.sin((np.pi/180) * np.linspace(-angle_max, angle_max, num=num, endpoint=True))
+
+# Single pass classification
+# counts and weight sums (wgt) of several named categories, computed chunk by chunk without building the subsets
+#  > results= classify("surface_source.h5", SUMMARY_CATEGORIES)  # {name: (count, weight)}
+#  > print(summary_table(results, "surface_source.h5"))
+SUMMARY_CATEGORIES = [
+    ('total', all_particles()),
+    ('fast (E>100meV)', energy_range(Emin=0.1)),
+    ('thermal (E<100meV)', energy_range(Emax=0.1)),
+    ('thermal_up', energy_range(Emax=0.1) & upward()),
+    ('thermal_down', energy_range(Emax=0.1) & downward()),
+    ('thermal_5deg', energy_range(Emax=0.1) & field_range('u.z', vmin=0.9962)),
+    ('cold (E<5meV)', energy_range(Emax=0.005)),
+]
+
+def classify(source, categories):
+    results = {name: [0, 0.] for name, _ in categories}
+    for chunk in _chunks(source):
+        wgt = get_field(chunk, 'wgt')
+        cache = {}
+        for name, selection in categories:
+            mask = selection.mask(chunk, cache)
+            results[name][0] += int(np.count_nonzero(mask))
+            results[name][1] += float(wgt.sum(where=mask))
+    return {name: tuple(result) for name, result in results.items()}
+
+def summary_table(results, title=""):
+    width = max([len(name) for name in results] + [8])
+    lines = [title] if title else []
+    lines.append(f"{'category':<{width}} {'count':>12} {'weight':>14}")
+    for name, (n, w) in results.items():
+        lines.append(f"{name:<{width}} {n:>12d} {w:>14.6g}")
+    return "\n".join(lines)
+
+# Sidecar index for repeated energy-angle range queries on the same file
+# built once and saved next to the file ("surface_source.index.h5"), rebuilt when the file size or mtime changes
+# the particles are sorted by u.z bucket then by energy: a query is a binary search of the energy window
+# in the buckets of the cone, u.z is only tested in the bucket crossing the cone edge
+#  > index= SourceIndex("surface_source.h5")
+#  > N_flux= get_flux(particles, 0, 0.1, 5, index=index) , same result as without index
+#  > n= index.count(0, 0.1, 5)
+
+class SourceIndex:
+    def __init__(self, filename="surface_source.h5", uz_edges=np.linspace(-1, 1, 201), rebuild=False):
+        self.filename = filename
+        self.index_file = os.path.splitext(filename)[0] + ".index.h5"
+        uz_edges = np.asarray(uz_edges, dtype=float)
+        if rebuild or not self._is_valid(uz_edges):
+            self._build(uz_edges)
+        with h5py.File(self.index_file, "r") as f:
+            self.uz_edges = f["uz_edges"][()]
+            self.offsets = f["offsets"][()]
+            self.E = f["E"][()]
+            self.uz = f["uz"][()]
+            self.order = f["order"][()]
+
+    def _is_valid(self, uz_edges):
+        if not os.path.exists(self.index_file):
+            return False
+        signature = _file_signature(self.filename)
+        with h5py.File(self.index_file, "r") as f:
+            return (all(f.attrs.get(key) == value for key, value in signature.items())
+                    and np.array_equal(f["uz_edges"][()], uz_edges))
+
+    def _build(self, uz_edges):
+        signature = _file_signature(self.filename)
+        columns = read_surface_source(self.filename, fields=['E', 'u.z'])
+        E, uz = columns['E'], columns['u.z']
+        nb = len(uz_edges) - 1
+        bucket = np.clip(np.searchsorted(uz_edges, uz, side='right') - 1, 0, nb - 1)
+        order = np.lexsort((E, bucket))
+        offsets = np.searchsorted(bucket[order], np.arange(nb + 1))
+        tmp_file = self.index_file + ".tmp"
+        with h5py.File(tmp_file, "w") as f:
+            f.attrs.update(signature)
+            f["uz_edges"] = uz_edges
+            f["offsets"] = offsets
+            f["E"] = E[order]
+            f["uz"] = uz[order]
+            f["order"] = order
+        os.replace(tmp_file, self.index_file)
+
+    # (start, stop, uz_test) ranges of the sorted arrays with Emin < E < Emax in the buckets reaching the cone
+    def _ranges(self, Emin, Emax, angle):
+        cos_min = np.cos(angle*np.pi/180)
+        Emin = -np.inf if Emin is None else Emin
+        Emax = np.inf if Emax is None else Emax
+        for b in range(len(self.uz_edges) - 1):
+            if self.uz_edges[b + 1] <= cos_min:
+                continue
+            start, stop = self.offsets[b], self.offsets[b + 1]
+            energies = self.E[start:stop]
+            lo = start + np.searchsorted(energies, Emin, side='right')
+            hi = start + np.searchsorted(energies, Emax, side='left')
+            if lo < hi:
+                yield lo, hi, self.uz_edges[b] <= cos_min
+
+    # positions in the file of the particles with Emin < E < Emax and angle wrt Oz < angle, in file order
+    def select(self, Emin=0, Emax=0.1, angle=5):
+        cos_min = np.cos(angle*np.pi/180)
+        parts = []
+        for lo, hi, uz_test in self._ranges(Emin, Emax, angle):
+            positions = self.order[lo:hi]
+            parts.append(positions[self.uz[lo:hi] > cos_min] if uz_test else positions)
+        return np.sort(np.concatenate(parts)) if parts else np.zeros(0, dtype=self.order.dtype)
+
+    def count(self, Emin=0, Emax=0.1, angle=5):
+        cos_min = np.cos(angle*np.pi/180)
+        return int(sum(np.count_nonzero(self.uz[lo:hi] > cos_min) if uz_test else hi - lo
+                       for lo, hi, uz_test in self._ranges(Emin, Emax, angle)))
+
+# Aggregation over archived runs (run_*/ directories written by openmc_archiving.createArchivedDataset)
+# the same categories and histograms are evaluated on the surface source of each run in a process pool
+# one row per run with the configuration.json parameters joined in, pandas.DataFrame(rows) gives a table
+#  > rows= aggregate_runs("run_*", SUMMARY_CATEGORIES, {'spot': Histogram(['r.x','r.y'], [binsX, binsY])}, processes=8)
+#  > rows[0] : {'run': 'run_20240712_101010/', 'source': 'Neutron 25MeV', 'geometry': 'Baseline_V1', 'geometry.e0': 26,
+#               'total.count': ..., 'total.weight': ..., ..., 'spot': <filled Histogram>}
+
+def _run_configuration(run_dir):
+    path = os.path.join(run_dir, 'configuration.json')
+    if not os.path.exists(path):
+        return {}, None
+    with open(path) as f:
+        configuration = json.load(f)
+    row = {'comment': configuration.get('comment')}
+    for kind in ('source', 'geometry'):
+        part = configuration.get(kind, {})
+        row[kind] = part.get(kind + 'Name')
+        for key, value in part.get(kind + 'Parameters', {}).items():
+            row[f"{kind}.{key}"] = value
+    return row, configuration.get('files', {}).get('surfaceWrite')
+
+def _aggregate_run(run_dir, categories, histograms, filename, chunk_size):
+    row, surface_source = _run_configuration(run_dir)
+    row = {'run': run_dir, **row}
+    maps = {name: Histogram(h.fields, h.bins, h.selection, h.weighted) for name, h in histograms.items()}
+    results = {name: [0, 0.] for name, _ in categories}
+    for chunk in iter_surface_source(os.path.join(run_dir, surface_source or filename), chunk_size):
+        for name, (n, w) in classify(chunk, categories).items():
+            results[name][0] += n
+            results[name][1] += w
+        for h in maps.values():
+            h.fill(chunk)
+    for name, (n, w) in results.items():
+        row[name + '.count'] = n
+        row[name + '.weight'] = w
+    row.update(maps)
+    return row
+
+# runs : glob pattern or list of run directories, processes=1 runs serially in the current process
+def aggregate_runs(runs, categories=SUMMARY_CATEGORIES, histograms=None, processes=None,
+                   filename="surface_source.h5", chunk_size=1000000):
+    run_dirs = sorted(glob.glob(runs)) if isinstance(runs, str) else list(runs)
+    args = [(run_dir, categories, histograms or {}, filename, chunk_size) for run_dir in run_dirs]
+    if processes == 1:
+        return [_aggregate_run(*a) for a in args]
+    with concurrent.futures.ProcessPoolExecutor(max_workers=processes) as executor:
+        return list(executor.map(_aggregate_run, *zip(*args))) if args else []
+
+# Writing and thinning surface sources for second-stage runs
+# the files are OpenMC source files, used with settings.source= openmc.FileSource("surface_source_thinned.h5")
+# and readable by read_surface_source / iter_surface_source
+# thinning is a Russian roulette: a particle survives with probability p and its weight is divided by p,
+# so the expected weighted flux of the selected particles is preserved
+#  > survival= [Survival('E', [0, 0.1, 1e9], [1., 0.01]), Survival('u.z', [-1, 0, 1], [0.1, 1.])]
+#  > n_read, n_written= thin_surface_source("surface_source.h5", "surface_source_thinned.h5", survival, particle_type('neutron'))
+
+class SourceWriter:
+    def __init__(self, filename, chunk_size=65536):
+        self.filename = filename
+        self.file = h5py.File(filename, "w")
+        self.file.attrs['filetype'] = np.bytes_(b'source')
+        self.dset = self.file.create_dataset("source_bank", shape=(0,), maxshape=(None,),
+                                             dtype=source_dtype, chunks=(chunk_size,))
+
+    def append(self, particles):
+        n = self.dset.shape[0]
+        self.dset.resize((n + len(particles),))
+        self.dset[n:] = np.asarray(particles, dtype=source_dtype)
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def write_surface_source(particles, filename="surface_source_thinned.h5"):
+    with SourceWriter(filename) as writer:
+        writer.append(particles)
+
+# survival probability by bins of a field, probabilities[i] for edges[i] <= field < edges[i+1], 1 outside the edges
+class Survival:
+    def __init__(self, field, edges, probabilities):
+        self.field = field
+        self.edges = np.asarray(edges, dtype=float)
+        self.probabilities = np.concatenate(([1.], np.asarray(probabilities, dtype=float), [1.]))
+        if len(self.probabilities) != len(self.edges) + 1:
+            raise ValueError("one probability is needed per bin")
+
+    def __call__(self, particles):
+        return self.probabilities[np.searchsorted(self.edges, get_field(particles, self.field), side='right')]
+
+# survival : a probability, a function of the particles (Survival) or a list of them, multiplied
+def _survival_probability(particles, survival):
+    p = np.ones(len(particles))
+    for s in (survival if isinstance(survival, (list, tuple)) else [survival]):
+        p *= s(particles) if callable(s) else s
+    return np.clip(p, 0., 1.)
+
+# the selected particles after Russian roulette, with weights divided by their survival probability
+def thin(particles, survival=1., selection=None, rng=None):
+    rng = rng or np.random.default_rng()
+    if selection is not None:
+        particles = select(particles, selection)
+    p = _survival_probability(particles, survival)
+    keep = rng.random(len(particles)) < p
+    kept = particles[keep]
+    kept['wgt'] /= p[keep]
+    return kept
+
+# streamed version, from a source file to a reduced source file
+def thin_surface_source(filename="surface_source.h5", out_filename="surface_source_thinned.h5",
+                        survival=1., selection=None, seed=None, chunk_size=1000000):
+    rng = np.random.default_rng(seed)
+    n_read = n_written = 0
+    with SourceWriter(out_filename) as writer:
+        for chunk in iter_surface_source(filename, chunk_size):
+            kept = thin(chunk, survival, selection, rng)
+            writer.append(kept)
+            n_read += len(chunk)
+            n_written += len(kept)
+    return n_read, n_written
+
+# Partition of a bank by surface and particle type in one pass
+#  > parts= partition(particles) , {(surf_id, particle): array}, views of one copy sorted by (surf_id, particle)
+#  > files= partition_surface_source("surface_source.h5") , {(12, 0): "surface_source_12_neutron.h5", ...}
+# the particles keep their original order within each part
+
+def partition(particles):
+    key = get_field(particles, 'surf_id').astype(np.int64) * len(PARTICLE_IDS) + get_field(particles, 'particle')
+    order = np.argsort(key, kind='stable')
+    ordered = particles[order]
+    keys, starts = np.unique(key[order], return_index=True)
+    stops = np.append(starts[1:], len(ordered))
+    return {(int(k // len(PARTICLE_IDS)), int(k % len(PARTICLE_IDS))): ordered[start:stop]
+            for k, start, stop in zip(keys, starts, stops)}
+
+# streamed version, one source file per (surf_id, particle) named after the input file
+def partition_surface_source(filename="surface_source.h5", chunk_size=1000000):
+    particle_names = {i: name for name, i in PARTICLE_IDS.items()}
+    writers = {}
+    try:
+        for chunk in iter_surface_source(filename, chunk_size):
+            for (surf_id, particle), part in partition(chunk).items():
+                if (surf_id, particle) not in writers:
+                    out_filename = f"{os.path.splitext(filename)[0]}_{surf_id}_{particle_names[particle]}.h5"
+                    writers[surf_id, particle] = SourceWriter(out_filename)
+                writers[surf_id, particle].append(part)
+    finally:
+        for writer in writers.values():
+            writer.close()
+    return {key: writer.filename for key, writer in writers.items()}
+
 def get_fast(particles):
-    N_fast= np.fromiter( (ruetwdsp for ruetwdsp in particles if is_fast(ruetwdsp)), dtype=source_dtype)
-    return N_fast
+    return select(particles, energy_range(Emin=0.1))
 
 def get_thermal(particles):
-    N_thermal= np.fromiter( (ruetwdsp for ruetwdsp in particles if is_thermal(ruetwdsp)), dtype=source_dtype)
-    return N_thermal
+    return select(particles, energy_range(Emax=0.1))
 
 def get_thermal_up(particles):
-    N_thermal_up= np.fromiter( (ruetwdsp for ruetwdsp in particles if is_thermal_up(ruetwdsp)), dtype=source_dtype)
-    return N_thermal_up
+    return select(particles, energy_range(Emax=0.1) & upward())
 
 def get_thermal_down(particles):
-    N_thermal_down= np.fromiter( (ruetwdsp for ruetwdsp in particles if is_thermal_down(ruetwdsp)), dtype=source_dtype)
-    return N_thermal_down
+    return select(particles, energy_range(Emax=0.1) & downward())
 
 def get_thermal_5deg(particles):
-    N_thermal_5deg= np.fromiter( (ruetwdsp for ruetwdsp in particles if is_thermal_in5deg(ruetwdsp)), dtype=source_dtype)
-    return N_thermal_5deg
+    return select(particles, energy_range(Emax=0.1) & field_range('u.z', vmin=0.9962))
 
 def get_cold(particles):
-    N_cold= np.fromiter( (ruetwdsp for ruetwdsp in particles if is_cold(ruetwdsp)), dtype=source_dtype)
-    return N_cold
+    return select(particles, energy_range(Emax=0.005))
 
 # neutrons with an energy below E and emitted within an angular range <angle in the z direction 
-def get_flux(particles, Emin=0, Emax=0.1, angle = 5):
-    N_flux= np.fromiter( (ruetwdsp for ruetwdsp in particles if is_emitted_in_angle(ruetwdsp,Emin,Emax,angle)), dtype=source_dtype)
-    return N_flux
+# with a SourceIndex of the file the particles were read from, only the matching particles are visited
+def get_flux(particles, Emin=0, Emax=0.1, angle = 5, index=None):
+    if index is not None:
+        positions = index.select(Emin, Emax, angle)
+        if isinstance(particles, dict):
+            return {name: values[positions] for name, values in particles.items()}
+        return particles[positions]
+    return select(particles, energy_range(Emin, Emax) & cone(angle))
     
 # posX= np.fromiter( (selectionX(ruetwdsp) for ruetwdsp in N_cold ), dtype= "float") #'<f8')
 # posY= np.fromiter( (selectionY(ruetwdsp) for ruetwdsp in N_cold ), dtype= "float") #'<f8')
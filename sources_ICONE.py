@@ -8,21 +8,464 @@ openmc sources
 
 from sources_icone import sourceBe25, sourceTa25, sourceBe40, sourceTa40
 from sources_icone import gamma_sourceBe25, gamma_sourceBe40, gamma_sourceTa25, gamma_sourceTa40
+from sources_icone import make_source   # make_source(openmc_space, 'Be', 40, 'neutron', uvw=(0., 0., 1.))
+from sources_icone import make_source_scan   # make_source_scan(directions, positions, 'Be', 40), tilted/displaced sources
+from sources_icone import coupled_source, split_by_particle   # neutrons + gammas in a single run
+from sources_icone import sample_source, write_sampled_source   # NumPy sampling, OpenMC source files without transport
+from sources_icone import biased_source   # biased_source(openmc_space, 'Be', 40, cos_min=0.9, factor=10.), forward-biased weighted source
+from sources_icone import verify_sources, format_report   # print(format_report(verify_sources())), checks without transport
 
 Created 2024.03.01  09:47:14 
 updated 2024.03.12  15:36
         2024.05.17 gamma_sources added 
         2024.06.12 add source_run_test
+        spectra gathered in NEUTRON_SOURCES / GAMMA_SOURCES, make_source factory
+        make_source_scan for tilted and displaced beams
+        coupled_source for coupled neutron + gamma runs
+        sample_source, write_sampled_source, biased_source
+        verify_sources
         
 run sources_icone.py to plot a test_source       
 @author: jdarpentigny
 """
 
+import functools
+import concurrent.futures
 import openmc
 import numpy as np
+from process_surf_source import source_dtype, PARTICLE_IDS, SourceWriter
 # from openmc import Source                     # openmc 0.13
 from openmc import IndependentSource as Source  # openmc 0.14
+
+# energy bins (eV) of the tabulated spectra
+ERG_BINS_BE = [316228.0, 398107.0, 501187.0, 630957.0, 794328.0, 1000000.0, 1258930.0, 1584890.0, 1995260.0, 2511890.0, 3162280.0, 3981070.0, 5011870.0, 6309570.0, 7943280.0, 10000000.0, 12589300.0, 15848900.0, 19952600.0, 25118900.0, 31622800.0]
+ERG_BINS = [100000.0, 125893.0, 158489.0, 199526.0, 251189.0, 316228.0, 398107.0, 501187.0, 630957.0, 794328.0, 1000000.0, 1258930.0, 1584890.0, 1995260.0, 2511890.0, 3162280.0, 3981070.0, 5011870.0, 6309570.0, 7943280.0, 10000000.0, 12589300.0, 15848900.0, 19952600.0, 25118900.0, 31622800.0]
+
+# neutron sources by (target, proton energy in MeV)
+#   strength : number of fast neutrons produced on target for a 80KW proton beam
+#   bins : one source per angular bin, (cos_bins, angular_distrib, erg_distrib, strength fraction)
+NEUTRON_SOURCES = {
+    ('Be', 25): {'strength': 4.4E14, 'erg_bins': ERG_BINS_BE, 'bins': [
+        ([-1, -0.9, -0.8, -0.7],
+         [0.3421, 0.3277, 0.3302, 0],
+         [0.1284, 0.1053, 0.0942, 0.0806, 0.0619, 0.0593, 0.0607, 0.0638, 0.0955, 0.0711, 0.0481, 0.0435, 0.0356, 0.0266, 0.0153, 0.0081, 0.0023, 0.0, 0.0, 0.0, 0],
+         0.0788),
+        ([-0.7, -0.6, -0.5, -0.4, -0.3, -0.2, -0.1, -1.94289e-16],
+         [0.12, 0.1259, 0.1303, 0.1407, 0.1508, 0.1601, 0.1722, 0],
+         [0.1736, 0.1622, 0.1219, 0.076, 0.065, 0.0486, 0.0414, 0.0413, 0.0462, 0.0595, 0.0499, 0.0338, 0.0308, 0.0229, 0.0152, 0.0078, 0.0036, 0.0005, 0.0, 0.0, 0],
+         0.2278),
+        ([-1.94289e-16, 0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7],
+         [0.1048, 0.1145, 0.1247, 0.1379, 0.1534, 0.1711, 0.1936, 0],
+         [0.0565, 0.0808, 0.1103, 0.1492, 0.1415, 0.0973, 0.05, 0.0387, 0.0332, 0.0355, 0.0439, 0.0505, 0.0331, 0.0283, 0.0223, 0.0151, 0.0089, 0.0045, 0.0003, 0.0, 0],
+         0.4),
+        ([0.7, 0.8, 0.9],
+         [0.4782, 0.5218, 0],
+         [0.0436, 0.0397, 0.0384, 0.0382, 0.0868, 0.2008, 0.1611, 0.0606, 0.0404, 0.0362, 0.0396, 0.0456, 0.0545, 0.0359, 0.0311, 0.0233, 0.0141, 0.0085, 0.0018, 0.0, 0],
+         0.181),
+        ([0.9, 1.0],
+         [1.0, 0],
+         [0.058, 0.0556, 0.0426, 0.0395, 0.0384, 0.1045, 0.2058, 0.1047, 0.0483, 0.0384, 0.0371, 0.0397, 0.0576, 0.0367, 0.0324, 0.0262, 0.0178, 0.0123, 0.0043, 0.0, 0],
+         0.1123),
+    ]},
+    ('Ta', 25): {'strength': 2E14, 'erg_bins': ERG_BINS, 'bins': [
+        ([-1, -0.9, -0.8, -0.7, -0.6, -0.5, -0.4, -0.3, -0.2, -0.1, -1.94289e-16],
+         [0.0999, 0.0954, 0.0983, 0.1029, 0.101, 0.0972, 0.103, 0.0989, 0.1014, 0.102, 0],
+         [0.0606, 0.0685, 0.0729, 0.0809, 0.0849, 0.0878, 0.0955, 0.0888, 0.0918, 0.0754, 0.0665, 0.0473, 0.0353, 0.0221, 0.0117, 0.0058, 0.0022, 0.0009, 0.0004, 0.0003, 0.0002, 0.0001, 0.0, 0.0, 0.0, 0],
+         0.4906),
+        ([-1.94289e-16, 0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 1.0],
+         [0.0962, 0.0946, 0.0979, 0.103, 0.0998, 0.1012, 0.0988, 0.1041, 0.1029, 0.1014, 0],
+         [0.056, 0.0665, 0.0633, 0.0792, 0.0821, 0.0892, 0.0893, 0.0953, 0.0835, 0.0807, 0.07, 0.0533, 0.0381, 0.0247, 0.0128, 0.0072, 0.0034, 0.0018, 0.0012, 0.0009, 0.0008, 0.0005, 0.0003, 0.0, 0.0, 0],
+         0.5094),
+    ]},
+    ('Be', 40): {'strength': 6.125E14, 'erg_bins': ERG_BINS_BE + [39810700.0], 'bins': [
+        ([-1, -0.9, -0.8, -0.7],
+         [0.3286, 0.3321, 0.3393, 0],
+         [0.1314, 0.1203, 0.0991, 0.0927, 0.0763, 0.0589, 0.0543, 0.0641, 0.0863, 0.0523, 0.0383, 0.0355, 0.0294, 0.0237, 0.0164, 0.0101, 0.0056, 0.0037, 0.0016, 0.0, 0.0, 0],
+         0.0789),
+        ([-0.7, -0.6, -0.5, -0.4, -0.3, -0.2, -0.1, -1.94289e-16],
+         [0.1208, 0.1253, 0.1333, 0.1394, 0.1488, 0.1606, 0.1719, 0],
+         [0.1529, 0.1448, 0.1042, 0.0849, 0.0733, 0.0594, 0.0481, 0.0466, 0.0514, 0.0604, 0.0471, 0.0328, 0.0288, 0.0237, 0.0178, 0.0114, 0.0063, 0.0036, 0.0021, 0.0006, 0.0, 0],
+         0.2213),
+        ([-1.94289e-16, 0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7],
+         [0.105, 0.113, 0.1246, 0.1374, 0.1529, 0.1724, 0.1948, 0],
+         [0.0901, 0.1028, 0.1095, 0.1264, 0.1189, 0.0869, 0.0512, 0.0371, 0.0321, 0.0322, 0.04, 0.0458, 0.0315, 0.0258, 0.0219, 0.0172, 0.0119, 0.0081, 0.0061, 0.0041, 0.0005, 0],
+         0.3918),
+        ([0.7, 0.8, 0.9],
+         [0.4675, 0.5325, 0],
+         [0.0554, 0.0601, 0.0518, 0.0547, 0.0762, 0.1473, 0.1551, 0.0716, 0.0348, 0.0293, 0.033, 0.0381, 0.0511, 0.031, 0.0282, 0.0239, 0.0186, 0.0139, 0.0116, 0.0106, 0.0039, 0],
+         0.1859),
+        ([0.9, 1.0],
+         [1.0, 0],
+         [0.062, 0.0622, 0.0493, 0.0484, 0.0508, 0.0746, 0.1525, 0.1346, 0.0512, 0.0287, 0.0312, 0.0348, 0.0503, 0.0346, 0.0297, 0.0258, 0.0221, 0.0174, 0.0151, 0.0161, 0.0084, 0],
+         0.122),
+    ]},
+    ('Ta', 40): {'strength': 5.25E14, 'erg_bins': ERG_BINS, 'bins': [
+        ([-1, -0.9, -0.8, -0.7, -0.6, -0.5, -0.4, -0.3, -0.2, -0.1, -1.94289e-16],
+         [0.0978, 0.0977, 0.0967, 0.0995, 0.0993, 0.1028, 0.1017, 0.1013, 0.1023, 0.1009, 0],
+         [0.0491, 0.0654, 0.0702, 0.0773, 0.0825, 0.0889, 0.0904, 0.0887, 0.0853, 0.078, 0.0688, 0.0552, 0.0401, 0.0267, 0.0164, 0.0091, 0.0042, 0.0019, 0.0008, 0.0005, 0.0003, 0.0002, 0.0001, 0.0001, 0.0, 0],
+         0.478),
+        ([-1.94289e-16, 0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 1.0],
+         [0.094, 0.097, 0.0965, 0.0981, 0.0985, 0.0979, 0.1027, 0.1045, 0.1059, 0.1048, 0],
+         [0.0494, 0.0623, 0.0629, 0.0726, 0.0778, 0.0817, 0.0903, 0.0903, 0.087, 0.0814, 0.0718, 0.0578, 0.0434, 0.0286, 0.0181, 0.0106, 0.0053, 0.0028, 0.0016, 0.0012, 0.001, 0.0008, 0.0006, 0.0004, 0.0002, 0],
+         0.522),
+    ]},
+}
+
+# isotropic gamma sources by (target, proton energy in MeV), energy bins ERG_BINS
+# the photon strength is the neutron strength * gammas_per_proton / neutrons_per_proton
+GAMMA_SOURCES = {
+    # from file: G:\gammas\gamma_25MeV_Be_r3.m
+    # protons 25 MeV on sphere Be target, r= 3 mm 
+    ('Be', 25): {'gammas_per_proton': 0.0003240734116, # twice the particles of half the angular range
+                 'neutrons_per_proton': 0.022161,
+                 'erg_distrib': [0.0, 0.0, 0.0087, 0.0035, 0.0165, 0.0415, 0.1304, 0.1975, 0.0329, 0.0209, 0.0035, 0.0011, 0.0013, 0.0028, 0.0011, 0.5382, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0]},
+    # from file: G:\gammas\gamma_40MeV_Be_r9.m
+    # protons 40 MeV on sphere Be target, r= 9 mm 
+    ('Be', 40): {'gammas_per_proton': 0.0014849306280000003, # twice the particles of half the angular range
+                 'neutrons_per_proton': 0.0488346,
+                 'erg_distrib': [0.0051, 0.0074, 0.0295, 0.0323, 0.0285, 0.0506, 0.2741, 0.3905, 0.0737, 0.0509, 0.0055, 0.0006, 0.0004, 0.0002, 0.0002, 0.0505, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0]},
+    # from file: G:\gammas\gamma_25MeV_Ta_L1_r015.m
+    # protons 25 MeV on cylindrical Ta target, L= 1.0 mm, r= 0.15 mm
+    ('Ta', 25): {'gammas_per_proton': 0.017206264496000004, # twice the particles of half the angular range
+                 'neutrons_per_proton': 0.0110034, # computation 25MeV_Ta_r3.m (0.0110809 on this target)
+                 'erg_distrib': [0.2912, 0.0452, 0.0758, 0.187, 0.0561, 0.095, 0.0673, 0.0436, 0.025, 0.0345, 0.0255, 0.0169, 0.0122, 0.0111, 0.0087, 0.0038, 0.001, 0.0002, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0]},
+    # from file: G:\gammas\gamma_40MeV_Ta_L2_r03.m
+    # protons 40 MeV on cylindrical Ta target, L= 2.1 mm, r= 0.3 mm
+    ('Ta', 40): {'gammas_per_proton': 0.04403489378, # twice the particles of half the angular range
+                 'neutrons_per_proton': 0.042238770808, # computation 40MeV_Ta_r3.m (0.0419996 on this target)
+                 'erg_distrib': [0.168, 0.0512, 0.088, 0.2089, 0.1029, 0.1028, 0.0776, 0.0431, 0.0332, 0.0388, 0.0261, 0.0179, 0.0131, 0.0103, 0.0087, 0.0055, 0.0032, 0.0007, 0.0001, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0]},
+}
+
+# the tables are converted once to read-only arrays, the openmc distributions (mutable, a caller may change
+# the reference_uvw or the bins of its source) are built from them for every source
+@functools.lru_cache(maxsize=None)
+def _array(table, key, *path):
+    """read-only float array of table[key][path[0]][path[1]]..., table 'neutron' or 'photon'"""
+    values = {'neutron': NEUTRON_SOURCES, 'photon': GAMMA_SOURCES}[table][key]
+    for item in path:
+        values = values[item]
+    array = np.array(values, dtype=float)
+    array.flags.writeable = False
+    return array
+
+def _neutron_energy(key, i):
+    return openmc.stats.Tabular(_array('neutron', key, 'erg_bins'), _array('neutron', key, 'bins', i, 2), interpolation='histogram')
+
+def _neutron_angle(key, i, uvw):
+    mu = openmc.stats.Tabular(_array('neutron', key, 'bins', i, 0), _array('neutron', key, 'bins', i, 1), interpolation='histogram')
+    return openmc.stats.PolarAzimuthal(mu= mu, phi= openmc.stats.Uniform(0.0, 2 * np.pi), reference_uvw= uvw)
+
+def _gamma_energy(key):
+    return openmc.stats.Tabular(ERG_BINS, _array('photon', key, 'erg_distrib'), interpolation='histogram')
+
+def make_source(openmc_space, target = 'Be', proton_energy = 25, particle = 'neutron', strength = None, uvw = (0., 0., 1.)):
+    """an OpenMC Source for a target hit by protons, from NEUTRON_SOURCES / GAMMA_SOURCES
+
+    The tables are converted to arrays once and cached, the distributions are
+    new objects for every call (they can be modified for one source only).
+
+    Parameters
+    ----------
+    openmc_space :  openmc.stats.Spatial
+        Spatial Distributions of neutron produced in proton target,
+        for instance openmc.stats.Box((xmin, ymin, zmin), (xmax, ymax, zmax))
+        or openmc.stats.Point((0., 0., 0.))
+    target : str, optional
+        'Be' or 'Ta'
+    proton_energy : int, optional
+        25 or 40 (MeV)
+    particle : str, optional
+        'neutron' or 'photon'
+    strength : float, optional
+        Number of fast NEUTRONS produced on target,
+        default is the 80KW value of NEUTRON_SOURCES
+    uvw : Iterable of float, optional   
+        Direction of proton beam (ignored for the isotropic photon sources)
+
     
+    Returns
+    -------
+    list of openmc.IndependentSource for neutrons (one per angular bin),
+    openmc.IndependentSource for photons
+
+    """
+    if particle not in ('neutron', 'photon'):
+        raise ValueError(f"particle must be 'neutron' or 'photon', not {particle!r}")
+    key = (target, proton_energy)
+    if strength is None:
+        strength = NEUTRON_SOURCES[key]['strength']
+    if particle == 'photon':
+        gamma = GAMMA_SOURCES[key]
+        gamma_source_strength = strength * gamma['gammas_per_proton'] / gamma['neutrons_per_proton']
+        return Source(space= openmc_space, energy= _gamma_energy(key), strength= gamma_source_strength, particle='photon')
+    uvw = tuple(float(c) for c in uvw)
+    return [Source(space= openmc_space, angle= _neutron_angle(key, i, uvw), energy= _neutron_energy(key, i), strength= strength * fraction)
+            for i, (_, _, _, fraction) in enumerate(NEUTRON_SOURCES[key]['bins'])]
+
+def coupled_source(openmc_space, target = 'Be', proton_energy = 25, strength = None, uvw = (0., 0., 1.)):
+    """neutron and photon sources of a target for a single coupled transport run
+
+    The photon source strength is set relative to the neutron one from
+    gammas_per_proton / neutrons_per_proton, as in the gamma_source functions.
+    Use it with settings.photon_transport = True and split the tallies with
+    split_by_particle. Tallies are per source particle: multiply by the sum of
+    the strengths of the list to get rates for the proton beam.
+
+    Returns
+    -------
+    list of openmc.IndependentSource, the neutron angular bins then the photon source
+
+    """
+    return (make_source(openmc_space, target, proton_energy, 'neutron', strength, uvw)
+            + [make_source(openmc_space, target, proton_energy, 'photon', strength)])
+
+def split_by_particle(tallies, particles = ('neutron', 'photon')):
+    """adds an openmc.ParticleFilter to every tally of a coupled run, neutron and photon scores are then separated"""
+    particle_filter = openmc.ParticleFilter(list(particles))
+    for tally in tallies:
+        tally.filters = list(tally.filters) + [particle_filter]
+    return tallies
+
+def rotation_matrix(uvw):
+    """rotation matrix bringing Oz onto the direction uvw (Rodrigues formula)"""
+    w = np.asarray(uvw, dtype=float)
+    w = w / np.linalg.norm(w)
+    c = w[2]
+    if c < -1 + 1e-12: # beam along -Oz : half turn around Ox
+        return np.diag([1., -1., -1.])
+    k = np.array([[0., 0., w[0]], [0., 0., w[1]], [-w[0], -w[1], 0.]]) # cross product matrix of Oz x w
+    return np.eye(3) + k + k @ k / (1 + c)
+
+def _directions(particles):
+    return np.stack([particles['u'][c] for c in 'xyz'], axis=1)
+
+def _histogram_mean(tabular):
+    """mean of a histogram openmc.stats.Tabular"""
+    x = np.asarray(tabular.x, dtype=float)
+    weights = np.asarray(tabular.p, dtype=float)[:-1] * np.diff(x)
+    return np.sum(weights * (x[:-1] + x[1:]) / 2) / weights.sum()
+
+def check_tilt(sources, uvw, n = 100000, rng = None, z_max = 5.):
+    """checks that neutron sources sample directions tilted along uvw
+
+    Particles are drawn with the sampler of sample_source: the cosines about
+    uvw of the particles of every angular bin must stay inside the bin, and
+    the mean direction of the whole list must be uvw times the mean cosine of
+    the tables (statistical check, in standard errors).
+
+    Returns
+    -------
+    float
+        largest deviation of the mean direction in standard errors, a
+        ValueError is raised for a particle outside its bin or above z_max
+    """
+    rng = rng or np.random.default_rng()
+    axis = np.asarray(uvw, dtype=float)
+    axis = axis / np.linalg.norm(axis)
+    for i, source in enumerate(sources):
+        mu = _directions(_sample_independent(source, max(1, n // len(sources)), rng)) @ axis
+        x = source.angle.mu.x
+        if mu.min() < x[0] - 1e-9 or mu.max() > x[-1] + 1e-9:
+            raise ValueError(f"source {i} is not tilted along {tuple(uvw)}: "
+                             f"cosines in [{mu.min():.3g}, {mu.max():.3g}] outside its bin [{x[0]:.3g}, {x[-1]:.3g}]")
+    strengths = np.array([source.strength for source in sources], dtype=float)
+    mean_mu = np.sum(strengths * [_histogram_mean(source.angle.mu) for source in sources]) / strengths.sum()
+    directions = _directions(sample_source(sources, n, rng))
+    error = directions.std(axis=0) / np.sqrt(n)
+    deviation = float((np.abs(directions.mean(axis=0) - mean_mu * axis) / np.maximum(error, 1e-12)).max())
+    if deviation > z_max:
+        raise ValueError(f"sources are not tilted along {tuple(uvw)} (mean direction off by {deviation:.3g} standard errors)")
+    return deviation
+
+def make_source_scan(directions = ((0., 0., 1.),), positions = None, target = 'Be', proton_energy = 25,
+                     particle = 'neutron', strength = None, openmc_space = None, check = True):
+    """sources for a set of beam directions and target positions, built in one call
+
+    The energy distributions and the mu and phi distributions of the angular
+    bins are built once and shared by all the sources of the scan (changing
+    one of them changes it for every variant), only the PolarAzimuthal of
+    each direction and the sources themselves are new objects.
+
+    Parameters
+    ----------
+    directions : array of shape (N, 3), optional
+        Directions of the proton beam, normalised here
+    positions : array of shape (N, 3), optional
+        Target positions, the sources are openmc.stats.Point at these positions
+    target, proton_energy, particle, strength :
+        as for make_source
+    openmc_space :  openmc.stats.Spatial, optional
+        Spatial distribution used for all the sources when positions is None
+        (default openmc.stats.Point((0., 0., 0.)))
+    check : bool, optional
+        checks the tilt of every neutron source list with check_tilt
+        (sampling of 100000 particles per direction)
+
+    Directions or positions of length 1 are used with every element of the other one.
+
+    Returns
+    -------
+    list of N make_source results, for (directions[i], positions[i])
+
+    """
+    directions = np.atleast_2d(np.asarray(directions, dtype=float))
+    directions = directions / np.linalg.norm(directions, axis=1)[:, None]
+    if positions is None:
+        spaces = [openmc_space if openmc_space is not None else openmc.stats.Point((0., 0., 0.))]
+    else:
+        spaces = [openmc.stats.Point(tuple(xyz)) for xyz in np.atleast_2d(np.asarray(positions, dtype=float))]
+    n = max(len(directions), len(spaces))
+    if len(directions) not in (1, n) or len(spaces) not in (1, n):
+        raise ValueError("directions and positions must have the same length (or a length of 1)")
+    shared = make_source(spaces[0], target, proton_energy, particle, strength)
+    sources = []
+    for i in range(n):
+        uvw = directions[i % len(directions)]
+        space = spaces[i % len(spaces)]
+        if particle == 'photon':
+            source = Source(space= space, energy= shared.energy, strength= shared.strength, particle='photon')
+        else:
+            source = [Source(space= space, energy= base.energy, strength= base.strength,
+                             angle= openmc.stats.PolarAzimuthal(mu= base.angle.mu, phi= base.angle.phi, reference_uvw= tuple(float(c) for c in uvw)))
+                      for base in shared]
+        if check and particle == 'neutron':
+            check_tilt(source, uvw)
+        sources.append(source)
+    return sources
+
+def _sample_histogram(tabular, n, rng):
+    """n values of a histogram openmc.stats.Tabular: bin by p * width, then uniform in the bin"""
+    if not isinstance(tabular, openmc.stats.Tabular) or tabular.interpolation != 'histogram':
+        raise ValueError(f"sampling of {tabular!r} is not implemented (histogram Tabular only)")
+    x = np.asarray(tabular.x, dtype=float)
+    width = np.diff(x)
+    cdf = np.cumsum(np.asarray(tabular.p, dtype=float)[:-1] * width)
+    bins = np.searchsorted(cdf, rng.random(n) * cdf[-1], side='right')
+    bins = np.minimum(bins, len(width) - 1)
+    return x[bins] + rng.random(n) * width[bins]
+
+def _sample_space(space, n, rng):
+    if isinstance(space, openmc.stats.Point):
+        return np.tile(np.asarray(space.xyz, dtype=float), (n, 1))
+    if isinstance(space, openmc.stats.Box):
+        lower_left = np.asarray(space.lower_left, dtype=float)
+        upper_right = np.asarray(space.upper_right, dtype=float)
+        return lower_left + rng.random((n, 3)) * (upper_right - lower_left)
+    raise ValueError(f"sampling of {type(space).__name__} is not implemented (Point or Box only)")
+
+def _sample_independent(source, n, rng):
+    particles = np.zeros(n, dtype=source_dtype)
+    xyz = _sample_space(source.space, n, rng)
+    angle = source.angle
+    if isinstance(angle, openmc.stats.PolarAzimuthal):
+        phi = angle.phi
+        if not (isinstance(phi, openmc.stats.Uniform) and np.isclose(phi.a, 0.) and np.isclose(phi.b, 2 * np.pi)):
+            raise ValueError(f"sampling of PolarAzimuthal with phi {phi!r} is not implemented (uniform in [0, 2pi] only)")
+        mu = _sample_histogram(angle.mu, n, rng)
+        uvw = angle.reference_uvw
+    elif angle is None or isinstance(angle, openmc.stats.Isotropic):
+        mu = rng.uniform(-1., 1., n)
+        uvw = (0., 0., 1.)
+    else:
+        raise ValueError(f"sampling of {type(angle).__name__} is not implemented (PolarAzimuthal or Isotropic only)")
+    phi = rng.uniform(0., 2 * np.pi, n)
+    sin_theta = np.sqrt(np.maximum(0., 1 - mu**2))
+    local = np.stack([sin_theta * np.cos(phi), sin_theta * np.sin(phi), mu], axis=1)
+    direction = local @ rotation_matrix(uvw).T
+    for i, c in enumerate('xyz'):
+        particles['r'][c] = xyz[:, i]
+        particles['u'][c] = direction[:, i]
+    particles['E'] = _sample_histogram(source.energy, n, rng)
+    particles['wgt'] = 1.
+    particles['particle'] = PARTICLE_IDS[str(source.particle)]
+    return particles
+
+def sample_source(sources, n, rng = None, bias = None):
+    """n particles drawn from ICONE sources with NumPy, without transport
+
+    A source of the list is picked according to its strength, then mu and E
+    are sampled in the histogram distributions and phi uniformly about uvw.
+
+    Parameters
+    ----------
+    sources : openmc.IndependentSource or list of them
+        as returned by make_source or the source functions
+        (histogram distributions, Point or Box spatial distributions,
+        PolarAzimuthal with uniform phi or Isotropic angular distributions,
+        a ValueError is raised for the others)
+    n : int
+        Number of particles
+    rng : numpy.random.Generator, optional
+    bias : dict, optional
+        {index of a source in the list: factor}, the picking probability of
+        these sources is multiplied by factor (before normalisation) and the
+        weights of their particles divided accordingly, see forward_bias
+
+    Returns
+    -------
+    numpy array of process_surf_source.source_dtype (E in eV, wgt= 1 without bias)
+
+    """
+    rng = rng or np.random.default_rng()
+    sources = sources if isinstance(sources, (list, tuple)) else [sources]
+    strengths = np.array([source.strength for source in sources], dtype=float)
+    probabilities = strengths / strengths.sum()
+    biased = probabilities * np.array([(bias or {}).get(i, 1.) for i in range(len(sources))])
+    biased /= biased.sum()
+    counts = rng.multinomial(n, biased)
+    parts = []
+    for source, k, p, q in zip(sources, counts, probabilities, biased):
+        part = _sample_independent(source, k, rng)
+        part['wgt'] = p / q if q > 0 else 0.
+        parts.append(part)
+    particles = np.concatenate(parts)
+    return particles[rng.permutation(n)]
+
+def forward_bias(sources, cos_min = 0.9, factor = 10.):
+    """bias of sample_source favouring the angular bins with cos >= cos_min (source4 for Be)
+
+    The weights stay unbiased, a factor f on a bin of probability p gives its
+    particles the weight (p f + 1 - p) / f. A ValueError is raised when no bin
+    starts at or above cos_min (the Ta tables have a single forward bin, cos >= 0).
+    """
+    bias = {i: factor for i, source in enumerate(sources)
+            if isinstance(source.angle, openmc.stats.PolarAzimuthal) and source.angle.mu.x[0] >= cos_min - 1e-12}
+    if not bias:
+        starts = sorted(float(source.angle.mu.x[0]) for source in sources if isinstance(source.angle, openmc.stats.PolarAzimuthal))
+        raise ValueError(f"no angular bin starts at or above cos_min = {cos_min}, the bins start at {starts}")
+    return bias
+
+def write_sampled_source(sources, n, filename = "source_sampled.h5", rng = None, chunk_size = 1000000, bias = None):
+    """writes n particles sampled with sample_source as an OpenMC source file
+
+    The file uses the source_dtype layout of process_surf_source, use it with
+    settings.source = openmc.FileSource(filename)
+    """
+    rng = rng or np.random.default_rng()
+    with SourceWriter(filename) as writer:
+        for start in range(0, n, chunk_size):
+            writer.append(sample_source(sources, min(chunk_size, n - start), rng, bias))
+    return filename
+
+def biased_source(openmc_space, target = 'Be', proton_energy = 25, cos_min = 0.9, factor = 10.,
+                  n = 1000000, filename = "source_biased.h5", strength = None, uvw = (0., 0., 1.), rng = None):
+    """a forward-biased neutron source for moderator studies
+
+    OpenMC independent sources carry no weight, so the biased source is a
+    file of n weighted particles (forward_bias + write_sampled_source): the
+    bins with cos >= cos_min (about uvw) are sampled factor times more often
+    and their weights lowered by the same factor, tallies stay unbiased.
+    The file takes 84 bytes per particle (84 MB for the default n = 1e6) and
+    is written in the current directory unless filename says otherwise.
+
+    Returns
+    -------
+    openmc.FileSource, to be used as settings.source
+    """
+    sources = make_source(openmc_space, target, proton_energy, 'neutron', strength, uvw)
+    write_sampled_source(sources, n, filename, rng, bias=forward_bias(sources, cos_min, factor))
+    return openmc.FileSource(filename)
+
 def sourceBe25(openmc_space, strength = 4.4E14, uvw = (0., 0., 1.)):
     """an OpenMC Source for Be target hit by 25MeV protons
 
@@ -46,62 +489,9 @@ def sourceBe25(openmc_space, strength = 4.4E14, uvw = (0., 0., 1.)):
         Distribution of phase space coordinates for source sites.
 
     """
-    # Be 25MeV 
-    # openmc_space = openmc.stats.Box((xmin, ymin, zmin), (xmax, ymax, zmax))
-    # strength = 4.4E14 # Be, 25MeV, 80KW # nb fast neutron produced 
-    # uvw = (0., 0., 1.) # reference_uvw of proton beam
-    
-    phi = openmc.stats.Uniform(0.0, 2 * np.pi) # 
-    erg_bins = [316228.0, 398107.0, 501187.0, 630957.0, 794328.0, 1000000.0, 1258930.0, 1584890.0, 1995260.0, 2511890.0, 3162280.0, 3981070.0, 5011870.0, 6309570.0, 7943280.0, 10000000.0, 12589300.0, 15848900.0, 19952600.0, 25118900.0, 31622800.0]
-    
-    cos_bins_0 = [-1, -0.9, -0.8, -0.7]
-    angular_distrib_0 = [0.3421, 0.3277, 0.3302, 0]
-    erg_distrib_0 = [0.1284, 0.1053, 0.0942, 0.0806, 0.0619, 0.0593, 0.0607, 0.0638, 0.0955, 0.0711, 0.0481, 0.0435, 0.0356, 0.0266, 0.0153, 0.0081, 0.0023, 0.0, 0.0, 0.0, 0]
-    cos0 = openmc.stats.Tabular(cos_bins_0, angular_distrib_0, interpolation='histogram')
-    angle0 = openmc.stats.PolarAzimuthal(mu= cos0, phi= phi, reference_uvw= uvw)
-    energy0 = openmc.stats.Tabular(erg_bins, erg_distrib_0, interpolation='histogram')
-    strength0 = strength * 0.0788
-    source0 = Source(space= openmc_space, angle= angle0, energy= energy0, strength= strength0)
-    
-    cos_bins_1 = [-0.7, -0.6, -0.5, -0.4, -0.3, -0.2, -0.1, -1.94289e-16]
-    angular_distrib_1 = [0.12, 0.1259, 0.1303, 0.1407, 0.1508, 0.1601, 0.1722, 0]
-    erg_distrib_1 = [0.1736, 0.1622, 0.1219, 0.076, 0.065, 0.0486, 0.0414, 0.0413, 0.0462, 0.0595, 0.0499, 0.0338, 0.0308, 0.0229, 0.0152, 0.0078, 0.0036, 0.0005, 0.0, 0.0, 0]
-    cos1 = openmc.stats.Tabular(cos_bins_1, angular_distrib_1, interpolation='histogram')
-    angle1 = openmc.stats.PolarAzimuthal(mu= cos1, phi= phi, reference_uvw= uvw)
-    energy1 = openmc.stats.Tabular(erg_bins, erg_distrib_1, interpolation='histogram')
-    strength1 = strength * 0.2278
-    source1 = Source(space= openmc_space, angle= angle1, energy= energy1, strength= strength1)
-    
-    cos_bins_2 = [-1.94289e-16, 0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7]
-    angular_distrib_2 = [0.1048, 0.1145, 0.1247, 0.1379, 0.1534, 0.1711, 0.1936, 0]
-    erg_distrib_2 = [0.0565, 0.0808, 0.1103, 0.1492, 0.1415, 0.0973, 0.05, 0.0387, 0.0332, 0.0355, 0.0439, 0.0505, 0.0331, 0.0283, 0.0223, 0.0151, 0.0089, 0.0045, 0.0003, 0.0, 0]
-    cos2 = openmc.stats.Tabular(cos_bins_2, angular_distrib_2, interpolation='histogram')
-    angle2 = openmc.stats.PolarAzimuthal(mu= cos2, phi= phi, reference_uvw= uvw)
-    energy2 = openmc.stats.Tabular(erg_bins, erg_distrib_2, interpolation='histogram')
-    strength2 = strength * 0.4
-    source2 = Source(space= openmc_space, angle= angle2, energy= energy2, strength= strength2)
-    
-    cos_bins_3 = [0.7, 0.8, 0.9]
-    angular_distrib_3 = [0.4782, 0.5218, 0]
-    erg_distrib_3 = [0.0436, 0.0397, 0.0384, 0.0382, 0.0868, 0.2008, 0.1611, 0.0606, 0.0404, 0.0362, 0.0396, 0.0456, 0.0545, 0.0359, 0.0311, 0.0233, 0.0141, 0.0085, 0.0018, 0.0, 0]
-    cos3 = openmc.stats.Tabular(cos_bins_3, angular_distrib_3, interpolation='histogram')
-    angle3 = openmc.stats.PolarAzimuthal(mu= cos3, phi= phi, reference_uvw= uvw)
-    energy3 = openmc.stats.Tabular(erg_bins, erg_distrib_3, interpolation='histogram')
-    strength3 = strength * 0.181
-    source3 = Source(space= openmc_space, angle= angle3, energy= energy3, strength= strength3)
-    
-    cos_bins_4 = [0.9, 1.0]
-    angular_distrib_4 = [1.0, 0]
-    erg_distrib_4 = [0.058, 0.0556, 0.0426, 0.0395, 0.0384, 0.1045, 0.2058, 0.1047, 0.0483, 0.0384, 0.0371, 0.0397, 0.0576, 0.0367, 0.0324, 0.0262, 0.0178, 0.0123, 0.0043, 0.0, 0]
-    cos4 = openmc.stats.Tabular(cos_bins_4, angular_distrib_4, interpolation='histogram')
-    angle4 = openmc.stats.PolarAzimuthal(mu= cos4, phi= phi, reference_uvw= uvw)
-    energy4 = openmc.stats.Tabular(erg_bins, erg_distrib_4, interpolation='histogram')
-    strength4 = strength * 0.1123
-    source4 = Source(space= openmc_space, angle= angle4, energy= energy4, strength= strength4)
-    #source = [source0, source1, source2, source3, source4] 
-    return [source0, source1, source2, source3, source4]
-
-def sourceTa25(openmc_space , strength = 2E14, uvw = (0., 0., 1.)) :
+    return make_source(openmc_space, 'Be', 25, 'neutron', strength, uvw)
+
+def sourceTa25(openmc_space , strength = 2E14, uvw = (0., 0., 1.)):
     """an OpenMC Source for Ta target hit by 25MeV protons
 
 
@@ -124,32 +514,7 @@ def sourceTa25(openmc_space , strength = 2E14, uvw = (0., 0., 1.)) :
         Distribution of phase space coordinates for source sites.
 
     """
-    # Ta25
-    # openmc_space = openmc.stats.Box((xmin, ymin, zmin), (xmax, ymax, zmax))
-    # strength = 2E14 # Ta, 25MeV, 80KW # nb fast neutron produced # to be modified
-    # uvw = (0., 0., 1.) # reference_uvw of proton beam
-    phi = openmc.stats.Uniform(0.0, 2 * np.pi) # 
-    erg_bins = [100000.0, 125893.0, 158489.0, 199526.0, 251189.0, 316228.0, 398107.0, 501187.0, 630957.0, 794328.0, 1000000.0, 1258930.0, 1584890.0, 1995260.0, 2511890.0, 3162280.0, 3981070.0, 5011870.0, 6309570.0, 7943280.0, 10000000.0, 12589300.0, 15848900.0, 19952600.0, 25118900.0, 31622800.0]
-    
-    cos_bins_0 = [-1, -0.9, -0.8, -0.7, -0.6, -0.5, -0.4, -0.3, -0.2, -0.1, -1.94289e-16]
-    angular_distrib_0 = [0.0999, 0.0954, 0.0983, 0.1029, 0.101, 0.0972, 0.103, 0.0989, 0.1014, 0.102, 0]
-    erg_distrib_0 = [0.0606, 0.0685, 0.0729, 0.0809, 0.0849, 0.0878, 0.0955, 0.0888, 0.0918, 0.0754, 0.0665, 0.0473, 0.0353, 0.0221, 0.0117, 0.0058, 0.0022, 0.0009, 0.0004, 0.0003, 0.0002, 0.0001, 0.0, 0.0, 0.0, 0]
-    cos0 = openmc.stats.Tabular(cos_bins_0, angular_distrib_0, interpolation='histogram')
-    angle0 = openmc.stats.PolarAzimuthal(mu= cos0, phi= phi, reference_uvw= uvw)
-    energy0 = openmc.stats.Tabular(erg_bins, erg_distrib_0, interpolation='histogram')
-    strength0 = strength * 0.4906
-    source0 = Source(space= openmc_space, angle= angle0, energy= energy0, strength= strength0)
-    
-    cos_bins_1 = [-1.94289e-16, 0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 1.0]
-    angular_distrib_1 = [0.0962, 0.0946, 0.0979, 0.103, 0.0998, 0.1012, 0.0988, 0.1041, 0.1029, 0.1014, 0]
-    erg_distrib_1 = [0.056, 0.0665, 0.0633, 0.0792, 0.0821, 0.0892, 0.0893, 0.0953, 0.0835, 0.0807, 0.07, 0.0533, 0.0381, 0.0247, 0.0128, 0.0072, 0.0034, 0.0018, 0.0012, 0.0009, 0.0008, 0.0005, 0.0003, 0.0, 0.0, 0]
-    cos1 = openmc.stats.Tabular(cos_bins_1, angular_distrib_1, interpolation='histogram')
-    angle1 = openmc.stats.PolarAzimuthal(mu= cos1, phi= phi, reference_uvw= uvw)
-    energy1 = openmc.stats.Tabular(erg_bins, erg_distrib_1, interpolation='histogram')
-    strength1 = strength * 0.5094
-    source1 = Source(space= openmc_space, angle= angle1, energy= energy1, strength= strength1)
-    #source = [source0, source1] 
-    return [source0, source1,]
+    return make_source(openmc_space, 'Ta', 25, 'neutron', strength, uvw)
 
 def sourceBe40(openmc_space, strength = 6.125E14, uvw = (0., 0., 1.)):
     """an OpenMC Source for Be target hit by 40MeV protons
@@ -174,62 +539,7 @@ def sourceBe40(openmc_space, strength = 6.125E14, uvw = (0., 0., 1.)):
         Distribution of phase space coordinates for source sites.
 
     """
-    # Be 40MeV 
-
-
-    phi = openmc.stats.Uniform(0.0, 2 * np.pi) # 
-    erg_bins = [316228.0, 398107.0, 501187.0, 630957.0, 794328.0, 1000000.0, 1258930.0, 1584890.0, 1995260.0, 2511890.0, 3162280.0, 3981070.0, 5011870.0, 6309570.0, 7943280.0, 10000000.0, 12589300.0, 15848900.0, 19952600.0, 25118900.0, 31622800.0, 39810700.0]
-    
-    
-    cos_bins_0 = [-1, -0.9, -0.8, -0.7]
-    angular_distrib_0 = [0.3286, 0.3321, 0.3393, 0]
-    erg_distrib_0 = [0.1314, 0.1203, 0.0991, 0.0927, 0.0763, 0.0589, 0.0543, 0.0641, 0.0863, 0.0523, 0.0383, 0.0355, 0.0294, 0.0237, 0.0164, 0.0101, 0.0056, 0.0037, 0.0016, 0.0, 0.0, 0]
-    cos0 = openmc.stats.Tabular(cos_bins_0, angular_distrib_0, interpolation='histogram')
-    angle0 = openmc.stats.PolarAzimuthal(mu= cos0, phi= phi, reference_uvw= uvw)
-    energy0 = openmc.stats.Tabular(erg_bins, erg_distrib_0, interpolation='histogram')
-    strength0 = strength * 0.0789
-    source0 = Source(space= openmc_space, angle= angle0, energy= energy0, strength= strength0)
-    
-    
-    cos_bins_1 = [-0.7, -0.6, -0.5, -0.4, -0.3, -0.2, -0.1, -1.94289e-16]
-    angular_distrib_1 = [0.1208, 0.1253, 0.1333, 0.1394, 0.1488, 0.1606, 0.1719, 0]
-    erg_distrib_1 = [0.1529, 0.1448, 0.1042, 0.0849, 0.0733, 0.0594, 0.0481, 0.0466, 0.0514, 0.0604, 0.0471, 0.0328, 0.0288, 0.0237, 0.0178, 0.0114, 0.0063, 0.0036, 0.0021, 0.0006, 0.0, 0]
-    cos1 = openmc.stats.Tabular(cos_bins_1, angular_distrib_1, interpolation='histogram')
-    angle1 = openmc.stats.PolarAzimuthal(mu= cos1, phi= phi, reference_uvw= uvw)
-    energy1 = openmc.stats.Tabular(erg_bins, erg_distrib_1, interpolation='histogram')
-    strength1 = strength * 0.2213
-    source1 = Source(space= openmc_space, angle= angle1, energy= energy1, strength= strength1)
-    
-    
-    cos_bins_2 = [-1.94289e-16, 0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7]
-    angular_distrib_2 = [0.105, 0.113, 0.1246, 0.1374, 0.1529, 0.1724, 0.1948, 0]
-    erg_distrib_2 = [0.0901, 0.1028, 0.1095, 0.1264, 0.1189, 0.0869, 0.0512, 0.0371, 0.0321, 0.0322, 0.04, 0.0458, 0.0315, 0.0258, 0.0219, 0.0172, 0.0119, 0.0081, 0.0061, 0.0041, 0.0005, 0]
-    cos2 = openmc.stats.Tabular(cos_bins_2, angular_distrib_2, interpolation='histogram')
-    angle2 = openmc.stats.PolarAzimuthal(mu= cos2, phi= phi, reference_uvw= uvw)
-    energy2 = openmc.stats.Tabular(erg_bins, erg_distrib_2, interpolation='histogram')
-    strength2 = strength * 0.3918
-    source2 = Source(space= openmc_space, angle= angle2, energy= energy2, strength= strength2)
-    
-    
-    cos_bins_3 = [0.7, 0.8, 0.9]
-    angular_distrib_3 = [0.4675, 0.5325, 0]
-    erg_distrib_3 = [0.0554, 0.0601, 0.0518, 0.0547, 0.0762, 0.1473, 0.1551, 0.0716, 0.0348, 0.0293, 0.033, 0.0381, 0.0511, 0.031, 0.0282, 0.0239, 0.0186, 0.0139, 0.0116, 0.0106, 0.0039, 0]
-    cos3 = openmc.stats.Tabular(cos_bins_3, angular_distrib_3, interpolation='histogram')
-    angle3 = openmc.stats.PolarAzimuthal(mu= cos3, phi= phi, reference_uvw= uvw)
-    energy3 = openmc.stats.Tabular(erg_bins, erg_distrib_3, interpolation='histogram')
-    strength3 = strength * 0.1859
-    source3 = Source(space= openmc_space, angle= angle3, energy= energy3, strength= strength3)
-    
-    
-    cos_bins_4 = [0.9, 1.0]
-    angular_distrib_4 = [1.0, 0]
-    erg_distrib_4 = [0.062, 0.0622, 0.0493, 0.0484, 0.0508, 0.0746, 0.1525, 0.1346, 0.0512, 0.0287, 0.0312, 0.0348, 0.0503, 0.0346, 0.0297, 0.0258, 0.0221, 0.0174, 0.0151, 0.0161, 0.0084, 0]
-    cos4 = openmc.stats.Tabular(cos_bins_4, angular_distrib_4, interpolation='histogram')
-    angle4 = openmc.stats.PolarAzimuthal(mu= cos4, phi= phi, reference_uvw= uvw)
-    energy4 = openmc.stats.Tabular(erg_bins, erg_distrib_4, interpolation='histogram')
-    strength4 = strength * 0.122
-    source4 = Source(space= openmc_space, angle= angle4, energy= energy4, strength= strength4)
-    return [source0, source1, source2, source3, source4]
+    return make_source(openmc_space, 'Be', 40, 'neutron', strength, uvw)
 
 def sourceTa40(openmc_space, strength = 5.25E14, uvw = (0., 0., 1.)):
     """an OpenMC Source for Ta target hit by 40MeV protons
@@ -254,32 +564,7 @@ def sourceTa40(openmc_space, strength = 5.25E14, uvw = (0., 0., 1.)):
         Distribution of phase space coordinates for source sites.
 
     """
-# Ta 40MeV 
-    phi = openmc.stats.Uniform(0.0, 2 * np.pi) # 
-    erg_bins = [100000.0, 125893.0, 158489.0, 199526.0, 251189.0, 316228.0, 398107.0, 501187.0, 630957.0, 794328.0, 1000000.0, 1258930.0, 1584890.0, 1995260.0, 2511890.0, 3162280.0, 3981070.0, 5011870.0, 6309570.0, 7943280.0, 10000000.0, 12589300.0, 15848900.0, 19952600.0, 25118900.0, 31622800.0]
-    
-    
-    cos_bins_0 = [-1, -0.9, -0.8, -0.7, -0.6, -0.5, -0.4, -0.3, -0.2, -0.1, -1.94289e-16]
-    angular_distrib_0 = [0.0978, 0.0977, 0.0967, 0.0995, 0.0993, 0.1028, 0.1017, 0.1013, 0.1023, 0.1009, 0]
-    erg_distrib_0 = [0.0491, 0.0654, 0.0702, 0.0773, 0.0825, 0.0889, 0.0904, 0.0887, 0.0853, 0.078, 0.0688, 0.0552, 0.0401, 0.0267, 0.0164, 0.0091, 0.0042, 0.0019, 0.0008, 0.0005, 0.0003, 0.0002, 0.0001, 0.0001, 0.0, 0]
-    cos0 = openmc.stats.Tabular(cos_bins_0, angular_distrib_0, interpolation='histogram')
-    angle0 = openmc.stats.PolarAzimuthal(mu= cos0, phi= phi, reference_uvw= uvw)
-    energy0 = openmc.stats.Tabular(erg_bins, erg_distrib_0, interpolation='histogram')
-    strength0 = strength * 0.478
-    source0 = Source(space= openmc_space, angle= angle0, energy= energy0, strength= strength0)
-    
-    
-    cos_bins_1 = [-1.94289e-16, 0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 1.0]
-    angular_distrib_1 = [0.094, 0.097, 0.0965, 0.0981, 0.0985, 0.0979, 0.1027, 0.1045, 0.1059, 0.1048, 0]
-    erg_distrib_1 = [0.0494, 0.0623, 0.0629, 0.0726, 0.0778, 0.0817, 0.0903, 0.0903, 0.087, 0.0814, 0.0718, 0.0578, 0.0434, 0.0286, 0.0181, 0.0106, 0.0053, 0.0028, 0.0016, 0.0012, 0.001, 0.0008, 0.0006, 0.0004, 0.0002, 0]
-    cos1 = openmc.stats.Tabular(cos_bins_1, angular_distrib_1, interpolation='histogram')
-    angle1 = openmc.stats.PolarAzimuthal(mu= cos1, phi= phi, reference_uvw= uvw)
-    energy1 = openmc.stats.Tabular(erg_bins, erg_distrib_1, interpolation='histogram')
-    strength1 = strength * 0.522
-    source1 = Source(space= openmc_space, angle= angle1, energy= energy1, strength= strength1)
-    #source = [source0, source1] 
-    return [source0, source1,]
-
+    return make_source(openmc_space, 'Ta', 40, 'neutron', strength, uvw)
 
 def gamma_sourceBe25(openmc_space, strength = 4.4E14): # isotropic source
     """a gamma OpenMC Source for Be target hit by 25MeV protons
@@ -303,16 +588,7 @@ def gamma_sourceBe25(openmc_space, strength = 4.4E14): # isotropic source
 
 
     """
-    # from file: G:\gammas\gamma_25MeV_Be_r3.m
-    # protons 25 MeV on sphere Be target, r= 3 mm 
-    Gammas_per_Proton =  0.0003240734116  # twice the particles of half the angular range
-    Neutrons_per_Proton = 0.022161 
-    gamma_source_strength = strength * Gammas_per_Proton / Neutrons_per_Proton
-    erg_bins = [100000.0, 125893.0, 158489.0, 199526.0, 251189.0, 316228.0, 398107.0, 501187.0, 630957.0, 794328.0, 1000000.0, 1258930.0, 1584890.0, 1995260.0, 2511890.0, 3162280.0, 3981070.0, 5011870.0, 6309570.0, 7943280.0, 10000000.0, 12589300.0, 15848900.0, 19952600.0, 25118900.0, 31622800.0]
-    erg_distrib = [0.0, 0.0, 0.0087, 0.0035, 0.0165, 0.0415, 0.1304, 0.1975, 0.0329, 0.0209, 0.0035, 0.0011, 0.0013, 0.0028, 0.0011, 0.5382, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0]
-    energy = openmc.stats.Tabular(erg_bins, erg_distrib, interpolation='histogram')
-    return openmc.Source(space= openmc_space, energy= energy, strength= gamma_source_strength, particle='photon')
-
+    return make_source(openmc_space, 'Be', 25, 'photon', strength)
 
 def gamma_sourceBe40(openmc_space, strength = 6.125E14): # isotropic source
     """a gamma OpenMC Source for Be target hit by 40MeV protons
@@ -335,16 +611,7 @@ def gamma_sourceBe40(openmc_space, strength = 6.125E14): # isotropic source
         Energy distribution of photons on source site.
 
     """
-    # from file: G:\gammas\gamma_40MeV_Be_r9.m
-    # protons 40 MeV on sphere Be target, r= 9 mm 
-    Gammas_per_Proton =  0.0014849306280000003  # twice the particles of half the angular range
-    Neutrons_per_Proton = 0.0488346 
-    gamma_source_strength = strength * Gammas_per_Proton / Neutrons_per_Proton
-    erg_bins = [100000.0, 125893.0, 158489.0, 199526.0, 251189.0, 316228.0, 398107.0, 501187.0, 630957.0, 794328.0, 1000000.0, 1258930.0, 1584890.0, 1995260.0, 2511890.0, 3162280.0, 3981070.0, 5011870.0, 6309570.0, 7943280.0, 10000000.0, 12589300.0, 15848900.0, 19952600.0, 25118900.0, 31622800.0]
-    erg_distrib = [0.0051, 0.0074, 0.0295, 0.0323, 0.0285, 0.0506, 0.2741, 0.3905, 0.0737, 0.0509, 0.0055, 0.0006, 0.0004, 0.0002, 0.0002, 0.0505, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0]
-    energy = openmc.stats.Tabular(erg_bins, erg_distrib, interpolation='histogram')
-    return openmc.Source(space= openmc_space, energy= energy, strength= gamma_source_strength, particle='photon')
-
+    return make_source(openmc_space, 'Be', 40, 'photon', strength)
 
 def gamma_sourceTa25(openmc_space, strength = 2E14): # isotropic source
     """a gamma OpenMC Source for Ta target hit by 25MeV protons
@@ -367,17 +634,7 @@ def gamma_sourceTa25(openmc_space, strength = 2E14): # isotropic source
         Energy distribution of photons on source site.
 
     """
-    # from file: G:\gammas\gamma_25MeV_Ta_L1_r015.m
-    # protons 25 MeV on cylindrical Ta target, L= 1.0 mm, r= 0.15 mm
-    Gammas_per_Proton =  0.017206264496000004  # twice the particles of half the angular range
-    Neutrons_per_Proton = 0.0110809 # should be calculated on a larger target
-    Neutrons_per_Proton = 0.0110034 # computation 25MeV_Ta_r3.m
-    gamma_source_strength = strength * Gammas_per_Proton / Neutrons_per_Proton
-    erg_bins = [100000.0, 125893.0, 158489.0, 199526.0, 251189.0, 316228.0, 398107.0, 501187.0, 630957.0, 794328.0, 1000000.0, 1258930.0, 1584890.0, 1995260.0, 2511890.0, 3162280.0, 3981070.0, 5011870.0, 6309570.0, 7943280.0, 10000000.0, 12589300.0, 15848900.0, 19952600.0, 25118900.0, 31622800.0]
-    erg_distrib = [0.2912, 0.0452, 0.0758, 0.187, 0.0561, 0.095, 0.0673, 0.0436, 0.025, 0.0345, 0.0255, 0.0169, 0.0122, 0.0111, 0.0087, 0.0038, 0.001, 0.0002, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0]
-    energy = openmc.stats.Tabular(erg_bins, erg_distrib, interpolation='histogram')
-    return openmc.Source(space= openmc_space, energy= energy, strength= gamma_source_strength, particle='photon')
-
+    return make_source(openmc_space, 'Ta', 25, 'photon', strength)
 
 def gamma_sourceTa40(openmc_space, strength = 5.25E14): # isotropic source
     """a gamma OpenMC Source for Ta target hit by 40MeV protons
@@ -400,16 +657,7 @@ def gamma_sourceTa40(openmc_space, strength = 5.25E14): # isotropic source
         Energy distribution of photons on source site.
 
     """
-    # from file: G:\gammas\gamma_40MeV_Ta_L2_r03.m
-    # protons 40 MeV on cylindrical Ta target, L= 2.1 mm, r= 0.3 mm
-    Gammas_per_Proton =  0.04403489378  # twice the particles of half the angular range
-    Neutrons_per_Proton = 0.0419996 # must be calculated on a larger target
-    Neutrons_per_Proton = 0.042238770808 # computation 40MeV_Ta_r3.m
-    gamma_source_strength = strength * Gammas_per_Proton / Neutrons_per_Proton
-    erg_bins = [100000.0, 125893.0, 158489.0, 199526.0, 251189.0, 316228.0, 398107.0, 501187.0, 630957.0, 794328.0, 1000000.0, 1258930.0, 1584890.0, 1995260.0, 2511890.0, 3162280.0, 3981070.0, 5011870.0, 6309570.0, 7943280.0, 10000000.0, 12589300.0, 15848900.0, 19952600.0, 25118900.0, 31622800.0]
-    erg_distrib = [0.168, 0.0512, 0.088, 0.2089, 0.1029, 0.1028, 0.0776, 0.0431, 0.0332, 0.0388, 0.0261, 0.0179, 0.0131, 0.0103, 0.0087, 0.0055, 0.0032, 0.0007, 0.0001, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0]
-    energy = openmc.stats.Tabular(erg_bins, erg_distrib, interpolation='histogram')
-    return openmc.Source(space= openmc_space, energy= energy, strength= gamma_source_strength, particle='photon')
+    return make_source(openmc_space, 'Ta', 40, 'photon', strength)
 
 def source_run_test(test_source = sourceBe40 ):
     materials = openmc.Materials([]) 
@@ -455,6 +703,105 @@ def source_run_test(test_source = sourceBe40 ):
     # print(data.shape)  # : (20, 40)
     return data, test_source.__name__
 
+# the sources of this module as (target, proton energy, particle)
+ALL_SOURCES = [(target, proton_energy, particle) for particle in ('neutron', 'photon')
+               for target, proton_energy in NEUTRON_SOURCES]
+
+# bins of the energy-cosine map of source_run_test
+TEST_ENERGY_BINS = np.logspace(4, 8, 41)
+TEST_COS_BINS = np.linspace(-1., 1., 21)
+
+def _bin_probabilities(tabular, edges):
+    """probabilities of the bins of edges for a histogram openmc.stats.Tabular (exact, its cdf is piecewise linear)"""
+    x = np.asarray(tabular.x, dtype=float)
+    cdf = np.concatenate(([0.], np.cumsum(np.asarray(tabular.p, dtype=float)[:-1] * np.diff(x))))
+    return np.diff(np.interp(edges, x, cdf / cdf[-1]))
+
+def _source_name(target, proton_energy, particle):
+    return f"{'gamma_' if particle == 'photon' else ''}source{target}{proton_energy}"
+
+def _table_checks(target, proton_energy, particle, tolerance):
+    """(description, value, passed) checks of the tabulated inputs of a source"""
+    checks = []
+    if particle == 'photon':
+        erg_distrib = GAMMA_SOURCES[target, proton_energy]['erg_distrib']
+        checks.append(("energy bins", len(erg_distrib), len(erg_distrib) == len(ERG_BINS)))
+        checks.append(("energy normalisation", sum(erg_distrib), abs(sum(erg_distrib) - 1) <= tolerance))
+        return checks
+    data = NEUTRON_SOURCES[target, proton_energy]
+    fractions = sum(fraction for _, _, _, fraction in data['bins'])
+    checks.append(("strength fractions", fractions, abs(fractions - 1) <= tolerance))
+    edges = [(cos_bins[0], cos_bins[-1]) for cos_bins, _, _, _ in data['bins']]
+    covered = edges[0][0] == -1 and edges[-1][1] == 1 and all(a[1] == b[0] for a, b in zip(edges, edges[1:]))
+    checks.append(("cos bins cover [-1, 1]", len(edges), covered))
+    for i, (cos_bins, angular_distrib, erg_distrib, _) in enumerate(data['bins']):
+        checks.append((f"bin {i} cos bins", len(cos_bins), len(cos_bins) == len(angular_distrib)
+                       and all(np.diff(cos_bins) > 0) and angular_distrib[-1] == 0 and min(angular_distrib) >= 0))
+        checks.append((f"bin {i} angular normalisation", sum(angular_distrib), abs(sum(angular_distrib) - 1) <= tolerance))
+        checks.append((f"bin {i} energy bins", len(erg_distrib), len(erg_distrib) == len(data['erg_bins'])
+                       and erg_distrib[-1] == 0 and min(erg_distrib) >= 0))
+        checks.append((f"bin {i} energy normalisation", sum(erg_distrib), abs(sum(erg_distrib) - 1) <= tolerance))
+    return checks
+
+def _expected_map(sources):
+    """energy-cosine probabilities of the sources, by analytic integration of the histograms"""
+    strengths = np.array([source.strength for source in sources], dtype=float)
+    expected = np.zeros((len(TEST_COS_BINS) - 1, len(TEST_ENERGY_BINS) - 1))
+    for source, weight in zip(sources, strengths / strengths.sum()):
+        if isinstance(source.angle, openmc.stats.PolarAzimuthal):
+            p_mu = _bin_probabilities(source.angle.mu, TEST_COS_BINS)
+        else: # isotropic
+            p_mu = np.diff(TEST_COS_BINS) / 2
+        expected += weight * np.outer(p_mu, _bin_probabilities(source.energy, TEST_ENERGY_BINS))
+    return expected
+
+def verify_source(target, proton_energy, particle, n = 1000000, seed = None, tolerance = 1e-2, z_max = 5.):
+    """checks a source against its tabulated inputs, without transport
+
+    The tables are checked (normalisations, bins), then n particles sampled
+    with sample_source are histogrammed on the energy-cosine map of
+    source_run_test and compared bin by bin to the analytic map.
+
+    Returns
+    -------
+    dict with 'name', 'checks' [(description, value, passed)], 'map' (20 cos x 40 energy,
+    cos decreasing as in source_run_test, normalised to one source particle),
+    'expected' (analytic map), 'max_z' (largest deviation in standard deviations), 'passed'
+    """
+    checks = _table_checks(target, proton_energy, particle, tolerance)
+    sources = make_source(openmc.stats.Point((0., 0., 0.)), target, proton_energy, particle)
+    sources = sources if isinstance(sources, list) else [sources]
+    particles = sample_source(sources, n, np.random.default_rng(seed))
+    sampled = np.histogram2d(particles['u']['z'], particles['E'], bins=(TEST_COS_BINS, TEST_ENERGY_BINS))[0] / n
+    expected = _expected_map(sources)
+    sigma = np.sqrt(expected * (1 - expected) / n)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        z = np.abs(sampled - expected) / sigma
+    z[(sigma == 0) & (sampled == 0)] = 0. # empty bins expected and found empty
+    checks.append((f"sampled map within {z_max} sigma", z.max(), z.max() <= z_max))
+    return {'name': _source_name(target, proton_energy, particle), 'checks': checks,
+            'map': sampled[::-1], 'expected': expected[::-1], 'max_z': z.max(),
+            'passed': all(passed for _, _, passed in checks)}
+
+def verify_sources(sources = ALL_SOURCES, n = 1000000, processes = None, seed = None, tolerance = 1e-2, z_max = 5.):
+    """verify_source for a list of (target, proton_energy, particle), in a process pool
+
+    print(format_report(verify_sources())) checks all the sources of the module.
+    """
+    seeds = np.random.SeedSequence(seed).spawn(len(sources))
+    with concurrent.futures.ProcessPoolExecutor(max_workers=processes) as executor:
+        futures = [executor.submit(verify_source, *source, n, s, tolerance, z_max) for source, s in zip(sources, seeds)]
+        return [future.result() for future in futures]
+
+def format_report(reports):
+    """pass/fail report of verify_sources"""
+    lines = []
+    for report in reports:
+        lines.append(f"{report['name']}: {'PASSED' if report['passed'] else 'FAILED'}")
+        for description, value, passed in report['checks']:
+            lines.append(f"    {'ok  ' if passed else 'FAIL'} {description}: {value:.6g}")
+    return "\n".join(lines)
+
 if __name__ == "__main__" :
     import matplotlib.pyplot as plt
     